@@ -0,0 +1,122 @@
+"""
+Exporta o modelo "Emotion" do DeepFace (Keras) para ONNX, em FP16 ou INT8,
+para ser usado pelo Step A via ONNX Runtime (cfg["MODELO_EMOCAO_ONNX"]).
+
+Roda uma única vez, fora do pipeline:
+    python src/exportar_modelo_emocao.py            # FP16
+    python src/exportar_modelo_emocao.py --int8     # INT8 (calibração estática)
+
+Dependências extras (não fazem parte do requirements.txt):
+    pip install onnxruntime tf2onnx onnxconverter-common
+"""
+import argparse
+import os
+
+from step_a_faces_emotions import criar_config, _detectar_bruto
+from utils_step_a import (
+    garantir_diretorio,
+    abrir_video,
+    calcular_caixas_recorte,
+    preparar_lote_emocao,
+    _construir_modelo_emocao,
+)
+
+# ============================================================
+# CONFIGURAÇÕES
+# ============================================================
+OPSET = 15
+N_CALIBRACAO = 200
+
+
+def exportar_fp32(caminho_saida: str) -> None:
+    import tensorflow as tf
+    import tf2onnx
+
+    modelo = _construir_modelo_emocao()
+    assinatura = (tf.TensorSpec((None, 48, 48, 1), tf.float32, name="entrada"),)
+    tf2onnx.convert.from_keras(modelo, input_signature=assinatura, opset=OPSET, output_path=caminho_saida)
+
+
+def converter_fp16(caminho_fp32: str, caminho_saida: str) -> None:
+    import onnx
+    from onnxconverter_common import float16
+
+    modelo = onnx.load(caminho_fp32)
+    # entrada/saída continuam float32: o pipeline não precisa saber do FP16
+    modelo_fp16 = float16.convert_float_to_float16(modelo, keep_io_types=True)
+    onnx.save(modelo_fp16, caminho_saida)
+
+
+def coletar_crops_calibracao(cfg: dict, n: int) -> list:
+    """Crops de rosto reais do vídeo de entrada, detectados e recortados pelo mesmo código do Step A."""
+    cap = abrir_video(cfg["VIDEO_ENTRADA"])
+    estado = {"opencl": False, "buffer_deteccao": None}
+    crops = []
+    indice = 0
+    while len(crops) < n:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        indice += 1
+        if indice % cfg["FRAME_STEP"] != 0:
+            continue
+
+        altura, largura = frame.shape[:2]
+        caixas, _, _ = _detectar_bruto(frame, cfg, estado)
+        for x1, y1, x2, y2 in calcular_caixas_recorte(caixas, largura, altura, cfg["PAD_RATIO"]).tolist():
+            if x2 > x1 and y2 > y1:
+                crops.append(frame[y1:y2, x1:x2].copy())
+    cap.release()
+    return crops[:n]
+
+
+def quantizar_int8(caminho_fp32: str, caminho_saida: str, cfg: dict) -> None:
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+
+    crops = coletar_crops_calibracao(cfg, N_CALIBRACAO)
+    if not crops:
+        raise RuntimeError("Nenhum rosto encontrado no vídeo para calibração INT8.")
+
+    nome_entrada = ort.InferenceSession(caminho_fp32, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class LeitorCalibracao(CalibrationDataReader):
+        def __init__(self):
+            self.lotes = iter([{nome_entrada: preparar_lote_emocao([c]).copy()} for c in crops])
+
+        def get_next(self):
+            return next(self.lotes, None)
+
+    quantize_static(
+        caminho_fp32,
+        caminho_saida,
+        LeitorCalibracao(),
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    print(f"Calibração INT8 com {len(crops)} rostos.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o modelo de emoção para ONNX (FP16/INT8).")
+    parser.add_argument("--int8", action="store_true", help="quantização estática INT8 em vez de FP16")
+    parser.add_argument("--saida", default=None, help="caminho do .onnx (padrão: cfg['MODELO_EMOCAO_ONNX'])")
+    args = parser.parse_args()
+
+    cfg = criar_config()
+    caminho_saida = args.saida or cfg["MODELO_EMOCAO_ONNX"]
+    garantir_diretorio(os.path.dirname(caminho_saida) or ".")
+
+    caminho_fp32 = os.path.splitext(caminho_saida)[0] + "_fp32.onnx"
+    exportar_fp32(caminho_fp32)
+
+    if args.int8:
+        quantizar_int8(caminho_fp32, caminho_saida, cfg)
+    else:
+        converter_fp16(caminho_fp32, caminho_saida)
+
+    print(f"✅ Modelo de emoção exportado: {caminho_saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,50 @@
 import sys
 import os
 
+# BLAS/OpenMP com 1 thread por chamada: o paralelismo vem dos estágios do pipeline, e pools
+# internos por cima deles só disputam núcleos (precisa vir antes do import do numpy/cv2/TF;
+# valores já definidos no ambiente são respeitados)
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
 # Adiciona o diretório atual ao path para encontrar os módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from step_a_faces_emotions import run_faces_emotions
-from step_b_activities import run_activities
+from step_a_faces_emotions import run_faces_emotions, criar_config
+from step_b_activities import run_activities, criar_config_b, AnalisadorAtividades
 from step_c_summary import gerar_relatorio 
 
+# ============================================================
+# CONFIGURAÇÕES
+# ============================================================
+# True = Step A e Step B no mesmo passo de decodificação: a pose roda sobre os frames
+# do Step A e sai um único vídeo final (sem gravar e reler stepA_annotated.mp4)
+PASSO_UNICO = True
+
+
+def run_all():
+    """Step A + Step B em uma só leitura do vídeo de entrada; gera os dois resumos."""
+    cfg = criar_config()
+    cfg_b = criar_config_b()
+    cfg["VIDEO_SAIDA"] = cfg_b["VIDEO_SAIDA"]
+    run_faces_emotions(cfg, AnalisadorAtividades(cfg_b))
+    print(f"🎥 Vídeo Final: {cfg['VIDEO_SAIDA']}")
+
 def main():
     print("🚀 INICIANDO PIPELINE COMPLETO - TECH CHALLENGE 4")
     
-    # 1. Executa Step A (Detecta Rostos, Emoções e Identidade)
-    # Gera: outputs/stepA_annotated.mp4 e outputs/stepA_summary.txt
-    run_faces_emotions()
-    
-    # 2. Executa Step B (Detecta Atividades no corpo)
-    # Lê o vídeo do Step A e gera: outputs/stepB_final.mp4 e outputs/stepB_summary.txt
-    run_activities()
+    if PASSO_UNICO:
+        # 1+2. Rostos/Emoções/Identidade e Atividades sobre os mesmos frames
+        # Gera: outputs/stepB_final.mp4, outputs/stepA_summary.txt e outputs/stepB_summary.txt
+        run_all()
+    else:
+        # 1. Executa Step A (Detecta Rostos, Emoções e Identidade)
+        # Gera: outputs/stepA_annotated.mp4 e outputs/stepA_summary.txt
+        run_faces_emotions()
+
+        # 2. Executa Step B (Detecta Atividades no corpo)
+        # Lê o vídeo do Step A e gera: outputs/stepB_final.mp4 e outputs/stepB_summary.txt
+        run_activities()
     
     # 3. Executa Step C (Gera Relatório Final)
     # Lê os txts anteriores e gera: outputs/relatorio_final.txt
@@ -1,62 +1,656 @@
-from collections import Counter, deque
+import os
+if __name__ == "__main__":
+    # só quando executado como script (ponto de entrada): BLAS/OpenMP com 1 thread por chamada,
+    # antes do import do numpy/cv2/TF. Importado como módulo, quem decide é o chamador (run_pipeline.py)
+    for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(_var, "1")
+
 from tqdm import tqdm
+from collections import deque
+import heapq
+import multiprocessing
+import queue
+import threading
 import time
 import cv2
+import numpy as np
 
 from utils_step_a import (
     garantir_diretorio,
     FileVideoStream,
+    LeitorSincrono,
+    LeitorProcesso,
     ler_metadados_video,
     criar_video_writer,
+    EscritorVideoAssincrono,
     detectar_faces,
+    pode_ter_face,
     extrair_bbox_e_confianca,
-    calcular_area_e_ar,
+    FacesFrame,
+    iniciar_rastreadores,
+    atualizar_rastreadores,
     AutoajusteLimiar,
-    passa_filtros_geometricos,
-    passa_filtro_confianca,
-    passa_persistencia,
-    recortar_rosto,
+    HistoricoIds,
+    filtrar_e_persistir,
+    CacheGrade,
+    RegistroFaces,
+    calcular_caixas_recorte,
     analisar_emocao,
     desenhar_anotacoes,
+    CamadaAnotacoes,
     escrever_resumo,
     carregar_banco_faces,
-    reconhecer_identidade
+    calcular_embeddings,
+    reconhecer_identidade,
+    FIM_FILA,
+    FalhaPipeline,
+    drenar_fila,
+    iniciar_thread,
+    executar_estagio,
+    executar_estagio_em_lote
 )
 
 def criar_config() -> dict:
     return {
         "VIDEO_ENTRADA": "data/input.mp4",
+        # "threaded" = FileVideoStream (decodifica em thread própria); "sync" = na thread de detecção;
+        # "processo" = LeitorProcesso (decodifica em outro processo, frames por memória compartilhada)
+        "LEITOR": "threaded",
         "PASTA_FACES_CONHECIDAS": "data/known_faces",
+        # cache dos encodings da galeria (fora da pasta versionada); só imagens novas/alteradas
+        # são recalculadas. None desliga o cache
+        "CACHE_BANCO_FACES": "outputs/known_faces_encodings.npz",
         "VIDEO_SAIDA": "outputs/stepA_annotated.mp4",
         "RESUMO_SAIDA": "outputs/stepA_summary.txt",
+        # log estruturado das faces contabilizadas (frame, bbox, emoção, identidade)
+        "LOG_FACES_SAIDA": "outputs/stepA_faces.npy",
 
         "FRAME_STEP": 3,
-        "DETECTOR_BACKEND": "opencv",
+        # True = só decodifica/processa os frames amostrados (o vídeo de saída
+        # fica só com eles, com fps / FRAME_STEP); False = vídeo completo
+        "SO_FRAMES_AMOSTRADOS": False,
+        # False = só análise: não desenha nem grava o vídeo anotado (resumo/log continuam)
+        "ESCREVER_VIDEO": True,
+        # com SO_FRAMES_AMOSTRADOS e FRAME_STEP >= GOP do vídeo, pula GOPs inteiros com seek
+        # no keyframe em vez de decodificá-los (keyframes listados via PyAV; backend "opencv")
+        "PULAR_POR_KEYFRAME": False,
+        # pula a inferência em frames amostrados quase idênticos ao último analisado
+        # (diferença média de luma 0-255; 0 = desligado)
+        "LIMIAR_CENA_ESTATICA": 0.0,
+        # nos frames não analisados, as bboxes seguem o rosto via tracker MOSSE
+        "RASTREAR_FACES": True,
+        # detector só a cada N frames amostrados; nos intermediários as faces da última
+        # detecção seguem por tracker e só emoção/identidade rodam (1 = detecta sempre;
+        # tracker perdido ou sem opencv-contrib → detecta)
+        "REDETECTAR_A_CADA": 1,
+        # "yunet" = cv2.FaceDetectorYN direto na resolução original; demais valores chamam o
+        # detector do DeepFace direto (detect_faces, sem o extract_faces): frame sem face = lista vazia
+        "DETECTOR_BACKEND": "yunet",
         "ENFORCE_DETECTION": False,
-
-        # Otimização: detecção em frame reduzido
-        "SCALE_DETECCAO": 0.7,
+        # backends do DeepFace: pula o detector nos frames em que um Haar a 1/4 da resolução
+        # não acha face nenhuma (cenas vazias); pode perder faces pequenas/de perfil
+        "PRE_FILTRO_HAAR": False,
+
+        # Otimização: detecção em frame reduzido (1.0 = sem redimensionar)
+        "SCALE_DETECCAO": 1.0,
+        # alternativa ao SCALE fixo: reduz o frame de detecção até o lado menor ter
+        # esse tamanho em px (ex.: 540 ou 640; 0 = usa SCALE_DETECCAO; nunca amplia)
+        "LADO_MENOR_DETECCAO": 0,
+        # downscale da detecção via OpenCL (T-API); só compensa com GPU/iGPU e frames grandes
+        "USAR_OPENCL": False,
+
+        # Leitura/escrita do vídeo: "opencv", "pyav" (FFmpeg direto, NVDEC/NVENC quando houver GPU)
+        # ou "cudacodec" (cv2.cudacodec; requer OpenCV compilado com CUDA);
+        # "ffmpeg" lê com o OpenCV e codifica em H.264 pelo executável ffmpeg (pipe, NVENC se houver)
+        "BACKEND_VIDEO": "opencv",
+        # "opencv": tenta o H.264 por hardware do cv2.VideoWriter antes do mp4v (a sondagem
+        # loga erros do libav em builds sem encoder de GPU, por isso fica desligada)
+        "H264_HARDWARE": False,
+        # frames já decodificados nesta largura máx. em px (ex.: 1280; 0 = resolução original):
+        # "pyav" reduz na conversão para BGR, "cudacodec" no NVDEC, "opencv" com resize após o read().
+        # Tudo depois da leitura (detecção, crops, vídeo de saída) trabalha na resolução reduzida
+        "LARGURA_MAX_DECODIFICACAO": 0,
 
         "DEBUG": True,
         "DEBUG_MAX_FRAMES": 10,
         "FRAMES_WARMUP_ANALISADOS": 150,
+        # percentis do warm-up: "exato" (np.percentile nas amostras guardadas)
+        # ou "p2" (estimador em streaming, memória constante; útil com warm-ups longos)
+        "ESTIMADOR_AUTOAJUSTE": "exato",
         "K_PERSISTENCIA": 2,
         "TAMANHO_GRID": 60,
         "PAD_RATIO": 0.15,
+
+        # Pipeline em estágios (threads + filas limitadas)
+        "TAMANHO_FILA_LEITURA": 64,
+        # frames no anel de memória compartilhada do LEITOR "processo" (cada um ocupa L*A*3 bytes)
+        "SLOTS_LEITOR_PROCESSO": 8,
+        "TAMANHO_FILA": 8,
+        # roda cada modelo uma vez em um frame sintético antes de abrir o vídeo
+        "AQUECER_MODELOS": True,
+        "WORKERS_EMOCAO": 1,
+        # processos só para o detector (0 = detecta na própria thread de detecção);
+        # filtros/persistência continuam na thread, na ordem dos frames
+        "PROCESSOS_DETECCAO": 0,
+        # máx. de frames cujas faces vão juntas em uma inferência de emoção
+        "LOTE_EMOCAO_FRAMES": 4,
+        # tempo máx. (s) esperando mais frames para completar o lote (0 = não espera)
+        "ESPERA_LOTE_EMOCAO": 0.0,
+        # modelo de emoção quantizado (gerado por exportar_modelo_emocao.py);
+        # se o arquivo não existir, usa o modelo Keras do DeepFace
+        "MODELO_EMOCAO_ONNX": "data/models/emotion_fp16.onnx",
+
+        # Reuso de resultados por célula do grid (em frames do vídeo de origem; 0 = desligado)
+        "CACHE_IDENTIDADE_FRAMES": 30,
+        "CACHE_EMOCAO_FRAMES": 0,
+        "CACHE_CAPACIDADE": 128,
+        # faces com lado menor que isso (px) nem passam pelo encoding: ficam "Desconhecido"
+        # (o dlib ampliaria o recorte para 150x150 e o encoding não seria confiável).
+        # 0 = desligado (todas as faces são reconhecidas); ex.: 20 para pular rostos minúsculos
+        "MIN_LADO_IDENTIDADE": 0,
     }
 
-def run_faces_emotions():
-    cfg = criar_config()
+# ============================================================
+# ESTÁGIOS DO PIPELINE
+# leitura (FileVideoStream) → detecção → emoção → identidade → escrita
+# ============================================================
+def _log_debug(cfg, estado, mensagem):
+    with estado["lock_debug"]:
+        if cfg["DEBUG"] and estado["debug_prints"] < cfg["DEBUG_MAX_FRAMES"]:
+            print(mensagem)
+            estado["debug_prints"] += 1
+
+def _reduzir_frame(frame, SCALE, estado):
+    """
+    cv2.resize escrevendo sempre no mesmo buffer (dst=) em vez de alocar um frame novo
+    por frame analisado; o buffer só é recriado se a resolução mudar.
+    Com USAR_OPENCL o resize roda via T-API (cv2.UMat) e só o frame reduzido volta à CPU.
+    """
+    H, W = frame.shape[:2]
+    dw, dh = round(W * SCALE), round(H * SCALE)
+    if estado["opencl"]:
+        return cv2.resize(cv2.UMat(frame), (dw, dh), interpolation=cv2.INTER_AREA).get()
+
+    buf = estado.get("buffer_deteccao")
+    if buf is None or buf.shape[:2] != (dh, dw):
+        buf = np.empty((dh, dw, 3), dtype=np.uint8)
+        estado["buffer_deteccao"] = buf
+    return cv2.resize(frame, (dw, dh), dst=buf, interpolation=cv2.INTER_AREA)
+
+def _detectar_bruto(frame, cfg, estado):
+    """
+    Só o detector: bboxes (K, 4) float64 no frame original e confiança (K,) (NaN = sem score).
+    Não toca no estado compartilhado além do buffer de redução, então pode rodar em outro processo.
+    """
+    SCALE = cfg["SCALE_DETECCAO"]
+    if cfg["LADO_MENOR_DETECCAO"] > 0:
+        SCALE = min(1.0, cfg["LADO_MENOR_DETECCAO"] / min(frame.shape[:2]))
+    reduzido = SCALE != 1.0
+
+    if cfg["PRE_FILTRO_HAAR"] and cfg["DETECTOR_BACKEND"] != "yunet" and not pode_ter_face(frame):
+        return np.empty((0, 4), dtype=np.float64), np.empty(0, dtype=np.float64), 0
+
+    # detecta no frame reduzido (mais rápido); com SCALE=1.0 não há cópia extra do frame
+    frame_small = _reduzir_frame(frame, SCALE, estado) if reduzido else frame
+
+    faces_detectadas = detectar_faces(
+        frame_bgr=frame_small,
+        detector_backend=cfg["DETECTOR_BACKEND"],
+        enforce_detection=cfg["ENFORCE_DETECTION"]
+    )
+
+    dados = [extrair_bbox_e_confianca(face_dict) for face_dict in faces_detectadas]
+    dados = [d for d in dados if d["w"] > 0 and d["h"] > 0]
+
+    # bbox no frame de detecção, uma linha por face
+    caixas = np.array([(d["x"], d["y"], d["w"], d["h"]) for d in dados], dtype=np.float64).reshape(-1, 4)
+    confianca = np.array([d["confianca"] if d["tem_confianca"] else np.nan for d in dados], dtype=np.float64)
+
+    # reprojeção para frame original
+    if reduzido:
+        caixas = np.trunc(caixas / SCALE)
+    return caixas, confianca, len(faces_detectadas)
+
+def _detectar_e_filtrar(frame, indice_frame, cfg, info, estado, deteccao=None):
+    """Detecção (ou o resultado já pronto de um processo de detecção) + filtros + crops."""
+    caixas, confianca, n_detectadas = deteccao if deteccao is not None else _detectar_bruto(frame, cfg, estado)
+
+    _log_debug(cfg, estado, f"[DEBUG] frame={indice_frame} | faces={n_detectadas} | backend={cfg['DETECTOR_BACKEND']} | scale={cfg['SCALE_DETECCAO']}")
+
+    if not len(caixas):
+        return FacesFrame()
+    caixas = caixas.astype(np.int64)
+
+    # clamp
+    H, W = frame.shape[:2]
+    x = np.clip(caixas[:, 0], 0, W - 1)
+    y = np.clip(caixas[:, 1], 0, H - 1)
+    w = np.clip(caixas[:, 2], 1, W - x)
+    h = np.clip(caixas[:, 3], 1, H - y)
+
+    area = w * h
+    ar = w / h
+
+    # autoajuste (warm-up)
+    auto = estado["auto"]
+    if not auto.limiares_definidos:
+        auto.adicionar_amostras(area, ar, confianca)
+        if auto.pronto_para_definir():
+            estado["limiares"] = auto.definir_limiares(estado["limiares"])
+
+    # filtros + persistência (kernel numba quando disponível)
+    aceitas = filtrar_e_persistir(
+        area, ar, confianca, x, y, estado["limiares"],
+        estado["historico_ids"], cfg["TAMANHO_GRID"], cfg["K_PERSISTENCIA"],
+    )
+
+    if not len(aceitas):
+        return FacesFrame()
+
+    # recorte no frame original (melhor p/ emoção e identidade), todas as caixas de uma vez
+    xywh = np.stack([x, y, w, h], axis=1)[aceitas]
+    caixas = calcular_caixas_recorte(xywh, info["largura"], info["altura"], cfg["PAD_RATIO"])
+    return FacesFrame(xywh, caixas, [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in caixas.tolist()])
+
+def _reiniciar_rastreio(frame, faces, cfg, estado):
+    """Semeia os rastreadores da detecção (REDETECTAR_A_CADA > 1) com as faces recém-detectadas."""
+    estado["rastreio"] = None
+    if cfg["REDETECTAR_A_CADA"] > 1 and len(faces):
+        rastreadores = iniciar_rastreadores(frame, faces)
+        if rastreadores:
+            estado["rastreio"] = {"rastreadores": rastreadores, "faces": FacesFrame(faces.xywh)}
+
+def _rastrear_faces(frame, cfg, info, estado):
+    """
+    Frame amostrado sem detector: move as faces da última detecção pelos rastreadores
+    e refaz os crops no frame atual (filtros/persistência já foram aplicados na detecção).
+    None quando não há o que rastrear ou algum rastreador se perdeu → detectar de novo.
+    """
+    rastreio = estado["rastreio"]
+    if rastreio is None:
+        return None
+    faces, perdidos = atualizar_rastreadores(rastreio["rastreadores"], frame, rastreio["faces"])
+    if perdidos:
+        return None
+    rastreio["faces"] = faces
+
+    caixas = calcular_caixas_recorte(faces.xywh, info["largura"], info["altura"], cfg["PAD_RATIO"])
+    return FacesFrame(faces.xywh, caixas, [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in caixas.tolist()])
+
+def _cena_estatica(frame, cfg, estado):
+    """
+    Porteiro de mudança de cena: compara a luma reduzida (64x36) com a do último frame
+    efetivamente analisado. Abaixo de LIMIAR_CENA_ESTATICA (diferença média por pixel)
+    o frame não passa pela inferência e as faces anteriores são reaproveitadas.
+    A referência só é atualizada quando há análise, então derivas lentas acabam disparando.
+    """
+    if cfg["LIMIAR_CENA_ESTATICA"] <= 0:
+        return False
+
+    luma = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA)
+    anterior = estado["luma_anterior"]
+    if anterior is not None and cv2.absdiff(luma, anterior).mean() < cfg["LIMIAR_CENA_ESTATICA"]:
+        return True
+
+    estado["luma_anterior"] = luma
+    return False
+
+# ============================================================
+# DETECÇÃO EM PROCESSOS (PROCESSOS_DETECCAO > 0)
+# ============================================================
+_estado_processo = {}
+
+def _iniciar_processo_deteccao(cfg):
+    """Initializer de cada processo: guarda a config e carrega o detector uma vez."""
+    cv2.setNumThreads(1)
+    _estado_processo.update({"cfg": cfg, "opencl": False, "buffer_deteccao": None})
+    detectar_faces(np.zeros((224, 224, 3), dtype=np.uint8), cfg["DETECTOR_BACKEND"], False)
+
+def _detectar_em_processo(frame):
+    return _detectar_bruto(frame, _estado_processo["cfg"], _estado_processo)
+
+def _worker_deteccao(cap_thread, fila_saida, cfg, info, estado):
+    """
+    Estágio 1: consome frames do leitor, roda detecção + filtros nos frames amostrados
+    e marca cada item com indice_frame (o escritor usa o índice para manter a ordem).
+
+    Com PROCESSOS_DETECCAO > 0 o detector roda em um pool de processos (fora do GIL);
+    os itens esperam em uma janela FIFO e os filtros/persistência são aplicados na
+    ordem dos frames quando o resultado do item da frente fica pronto.
+
+    Convenção do campo "faces" em cada item:
+    - None       → frame não amostrado (reaproveita as faces do último frame analisado)
+    - FacesFrame → resultado da análise (vazio quando a análise falhou)
+    """
+    falha = estado["falha"]
+    n_processos = cfg["PROCESSOS_DETECCAO"]
+    pool = None
+    janela = deque()  # (item, AsyncResult / RASTREAR / None), em ordem de frame
+    RASTREAR = "rastrear"
+
+    def concluir(item, detectar):
+        # detectar: None (frame não analisado), RASTREAR ou função que devolve a detecção bruta
+        if detectar is not None:
+            try:
+                frame = item["frame"]
+                faces = _rastrear_faces(frame, cfg, info, estado) if detectar is RASTREAR else None
+                if faces is None:
+                    if detectar is RASTREAR:
+                        detectar = lambda: _detectar_bruto(frame, cfg, estado)
+                    faces = _detectar_e_filtrar(frame, item["indice"], cfg, info, estado, detectar())
+                    _reiniciar_rastreio(frame, faces, cfg, estado)
+                item["faces"] = faces
+                item["analisado"] = True
+            except Exception as e:
+                item["faces"] = FacesFrame()
+                if cfg["DEBUG"]:
+                    print(f"Erro frame {item['indice']}: {e}")
+        fila_saida.put(item)
+
+    try:
+        if n_processos > 0:
+            # "spawn": o processo pai já tem threads e o TF carregado, fork não é seguro
+            pool = multiprocessing.get_context("spawn").Pool(
+                n_processos, initializer=_iniciar_processo_deteccao, initargs=(cfg,)
+            )
+
+        indice_frame = 0
+        n_analisados = 0
+
+        # para de ler assim que algum estágio falhar
+        while cap_thread.more() and not falha.ativa:
+            ret, frame = cap_thread.read()
+
+            if not ret:
+                if not cap_thread.stopped:
+                    time.sleep(0.01)
+                    continue
+                break
+
+            if frame is None:
+                break
+
+            item = {"indice": indice_frame, "frame": frame, "faces": None, "analisado": False}
+
+            # com SO_FRAMES_AMOSTRADOS o leitor já entrega só os frames do passo
+            amostrado = cfg["SO_FRAMES_AMOSTRADOS"] or indice_frame % cfg["FRAME_STEP"] == 0
+            analisar = amostrado and not _cena_estatica(frame, cfg, estado)
+            rastrear = analisar and n_analisados % cfg["REDETECTAR_A_CADA"] != 0
+            n_analisados += analisar
+            if pool is None:
+                concluir(item, RASTREAR if rastrear else (lambda f=frame: _detectar_bruto(f, cfg, estado)) if analisar else None)
+            else:
+                if rastrear:
+                    janela.append((item, RASTREAR))
+                else:
+                    janela.append((item, pool.apply_async(_detectar_em_processo, (frame,)) if analisar else None))
+                # até 2 frames por processo em voo; o da frente sai assim que estiver pronto
+                while janela and (len(janela) > 2 * n_processos or janela[0][1] in (None, RASTREAR) or janela[0][1].ready()):
+                    concluir(*_resolver(janela.popleft()))
+            indice_frame += 1
+
+        # erro do leitor em thread/processo: more() já ficou False sem read() relançar
+        if getattr(cap_thread, "erro", None) is not None:
+            raise cap_thread.erro
+
+        while janela and not falha.ativa:
+            concluir(*_resolver(janela.popleft()))
+    except Exception as e:
+        falha.registrar(e)
+    finally:
+        if pool is not None:
+            if falha.ativa:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+        # uma sentinela por worker de emoção, mesmo com falha (senão os estágios seguintes esperam para sempre)
+        for _ in range(cfg["WORKERS_EMOCAO"]):
+            fila_saida.put(FIM_FILA)
+
+def _resolver(entrada):
+    """(item, AsyncResult / marcador / None) da janela → (item, argumento de concluir)."""
+    item, pendente = entrada
+    return item, pendente.get if hasattr(pendente, "get") else pendente
+
+def _processar_emocao(itens, cfg, estado):
+    """
+    Emoção em lote: junta os crops de todos os frames analisados do lote
+    e roda uma única inferência; depois devolve cada resultado à sua face.
+    Faces com emoção no cache (CACHE_EMOCAO_FRAMES) não entram no lote.
+    """
+    cache = estado["cache_emocao"]
+    analisados = [item for item in itens if item["analisado"]]
+    pendentes = []
+
+    for item in analisados:
+        faces = item["faces"]
+        crops, faces.crops = faces.crops, []
+        # validade do cache em frames do vídeo de origem (independe de SO_FRAMES_AMOSTRADOS)
+        indice_origem = item["indice"] * estado["passo_leitura"]
+        for j, bbox in enumerate(faces.xywh.tolist()):
+            chave = cache.chave(*bbox)
+            faces.emocoes[j] = cache.obter(chave, indice_origem)
+            if faces.emocoes[j] is None:
+                pendentes.append((indice_origem, faces, j, chave, crops[j]))
+
+    try:
+        resultados = analisar_emocao([p[4] for p in pendentes], cfg["MODELO_EMOCAO_ONNX"])
+    except Exception as e:
+        for item in analisados:
+            item["faces"], item["analisado"] = FacesFrame(), False
+        if cfg["DEBUG"]:
+            print(f"Erro frames {[item['indice'] for item in analisados]}: {e}")
+        return itens
+
+    for (indice, faces, j, chave, _), emocao in zip(pendentes, resultados):
+        faces.emocoes[j] = emocao
+        if emocao is not None:
+            cache.guardar(chave, faces.emocoes[j], indice)
+
+    for item in analisados:
+        faces = item["faces"]
+        validas = [j for j, emocao in enumerate(faces.emocoes) if emocao is not None]
+        if len(validas) < len(faces):
+            for _ in range(len(faces) - len(validas)):
+                _log_debug(cfg, estado, "[DEBUG] emoção falhou para um face_crop")
+            item["faces"] = faces.selecionar(validas)
+
+    return itens
+
+def _processar_identidade(item, cfg, estado, indice_faces, known_names):
+    """
+    Identidade em lote por frame; faces cuja célula do grid já tem nome no cache
+    (CACHE_IDENTIDADE_FRAMES) não recalculam o encoding, e faces menores que
+    MIN_LADO_IDENTIDADE nem chegam ao encoding.
+    """
+    if not item["analisado"]:
+        return item
+
+    try:
+        faces = item["faces"]
+        if indice_faces is None:
+            return item
+
+        cache = estado["cache_identidade"]
+        indice_origem = item["indice"] * estado["passo_leitura"]
+        chaves = [cache.chave(*bbox) for bbox in faces.xywh.tolist()]
+        pequenas = faces.xywh[:, 2:].min(axis=1) < cfg["MIN_LADO_IDENTIDADE"]
+        pendentes = []
+        for j, chave in enumerate(chaves):
+            if pequenas[j]:
+                # fica com o nome padrão ("Desconhecido") e não entra no cache:
+                # uma face maior na mesma célula ainda é reconhecida
+                continue
+            nome = cache.obter(chave, indice_origem)
+            if nome is None:
+                pendentes.append(j)
+            else:
+                faces.nomes[j] = nome
+
+        if pendentes:
+            Q = calcular_embeddings(item["frame"], faces.caixas[pendentes].tolist())
+            # sem encoding as faces ficam "Desconhecido" só neste frame: falha não entra no cache
+            for j, nome in zip(pendentes, reconhecer_identidade(Q, indice_faces, known_names)):
+                faces.nomes[j] = nome
+                cache.guardar(chaves[j], nome, indice_origem)
+    except Exception as e:
+        item["faces"], item["analisado"] = FacesFrame(), False
+        if cfg["DEBUG"]:
+            print(f"Erro frame {item['indice']}: {e}")
+
+    return item
+
+def _aquecer_modelos(cfg, indice_faces, known_names):
+    """
+    Uma passada com um frame sintético por modelo antes do pipeline começar:
+    carrega pesos, inicializa sessões/contextos e compila os kernels numba,
+    para que esse custo não caia nos primeiros frames reais e trave as filas.
+    """
+    dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+    etapas = [
+        lambda: detectar_faces(dummy, cfg["DETECTOR_BACKEND"], False),
+        lambda: analisar_emocao([dummy], cfg["MODELO_EMOCAO_ONNX"]),
+        lambda: filtrar_e_persistir(
+            np.ones(1, np.int64), np.ones(1), np.ones(1), np.zeros(1, np.int64), np.zeros(1, np.int64),
+            {"MIN_AREA_FACE": 0, "MAX_AREA_FACE": 1, "MIN_AR": 0.0, "MAX_AR": 2.0, "MIN_CONFIANCA": 0.0},
+            HistoricoIds(maxlen=1), cfg["TAMANHO_GRID"], cfg["K_PERSISTENCIA"],
+        ),
+    ]
+    if indice_faces is not None:
+        etapas.append(lambda: reconhecer_identidade(calcular_embeddings(dummy, [(0, 0, 224, 224)]), indice_faces, known_names))
+
+    for etapa in etapas:
+        try:
+            etapa()
+        except Exception as e:
+            if cfg["DEBUG"]:
+                print(f"[DEBUG] aquecimento falhou: {e}")
+
+def _worker_escrita(fila_entrada, escritor, cfg, info, estado, barra, atividades=None):
+    """
+    Estágio final: reordena os frames por indice_frame (heap), desenha e grava.
+    Com mais de um worker de emoção os itens podem chegar fora de ordem.
+    Nos frames não analisados, as faces do último frame analisado são movidas
+    pelos rastreadores (RASTREAR_FACES) em vez de ficarem paradas.
+    Sem rastreadores as faces só mudam a cada frame analisado: as anotações viram uma
+    camada (CamadaAnotacoes) montada uma vez e copiada em cada frame até a próxima análise.
+    Sem escritor (ESCREVER_VIDEO = False) só contabiliza: nada é desenhado nem gravado.
+    Com `atividades` (passo único com o Step B), a pose roda aqui, em ordem, sobre o
+    frame ainda sem anotações, e o esqueleto/atividade vão no mesmo vídeo de saída.
+    """
+    pendentes = []
+    proximo_indice = 0
+    faces_ultimo_frame = FacesFrame()
+    rastreadores = []
+    camada = None
+
+    def anotar(item):
+        nonlocal faces_ultimo_frame, rastreadores, camada
+        frame = item["frame"]
+
+        # rastreadores leem o frame antes do desenho (que é feito in-place)
+        if item["faces"] is not None:
+            faces_ultimo_frame = item["faces"]
+            rastreadores = iniciar_rastreadores(frame, faces_ultimo_frame) if cfg["RASTREAR_FACES"] else []
+            camada = None
+        elif rastreadores:
+            faces_ultimo_frame, _ = atualizar_rastreadores(rastreadores, frame, faces_ultimo_frame)
+
+        if rastreadores:
+            desenhar_anotacoes(frame, faces_ultimo_frame, info["largura"], info["altura"])
+        else:
+            if camada is None:
+                camada = CamadaAnotacoes(faces_ultimo_frame, info["largura"], info["altura"])
+            camada.aplicar(frame)
+        return frame
+
+    def passo_atividades(metodo, item, frame):
+        # erro da pose sobe pelo mesmo caminho dos estágios (FalhaPipeline), com o frame no contexto
+        try:
+            metodo(frame)
+        except Exception as e:
+            raise RuntimeError(f"Step B (atividades) falhou no frame {item['indice']}: {e}") from e
+
+    def escrever(item):
+        if atividades is not None:
+            passo_atividades(atividades.analisar, item, item["frame"])
+        if escritor is not None:
+            frame = anotar(item)
+            if atividades is not None:
+                passo_atividades(atividades.desenhar, item, frame)
+            escritor.write(frame)
+
+        if item["analisado"]:
+            estado["frames_analisados"] += 1
+            estado["total_faces"] += len(item["faces"])
+            # o log guarda o índice no vídeo de origem (com SO_FRAMES_AMOSTRADOS o leitor pula frames)
+            estado["registro_faces"].adicionar(item["indice"] * estado["passo_leitura"], item["faces"])
+        barra.update(1)
+
+    falha = estado["falha"]
+    fins = 0
+    try:
+        while True:
+            item = fila_entrada.get()
+            if item is FIM_FILA:
+                fins = 1
+                break
+            if falha.ativa:
+                continue  # algum estágio falhou: só esvazia a fila até a sentinela
+
+            heapq.heappush(pendentes, (item["indice"], item))
+            while pendentes and pendentes[0][0] == proximo_indice:
+                escrever(heapq.heappop(pendentes)[1])
+                proximo_indice += 1
+
+        # segurança: descarrega o que sobrou (só ocorre se algum índice se perdeu)
+        while pendentes and not falha.ativa:
+            escrever(heapq.heappop(pendentes)[1])
+    except Exception as e:
+        falha.registrar(e)
+        drenar_fila(fila_entrada, fins, 1)
+
+
+LEITORES = {
+    "threaded": lambda cfg, passo: FileVideoStream(
+        cfg["VIDEO_ENTRADA"], cfg["TAMANHO_FILA_LEITURA"], cfg["BACKEND_VIDEO"], passo, cfg["PULAR_POR_KEYFRAME"],
+        cfg["LARGURA_MAX_DECODIFICACAO"],
+    ),
+    "sync": lambda cfg, passo: LeitorSincrono(
+        cfg["VIDEO_ENTRADA"], cfg["BACKEND_VIDEO"], passo, cfg["PULAR_POR_KEYFRAME"], cfg["LARGURA_MAX_DECODIFICACAO"]
+    ),
+    "processo": lambda cfg, passo: LeitorProcesso(
+        cfg["VIDEO_ENTRADA"], cfg["SLOTS_LEITOR_PROCESSO"], cfg["BACKEND_VIDEO"], passo, cfg["PULAR_POR_KEYFRAME"],
+        cfg["LARGURA_MAX_DECODIFICACAO"],
+    ),
+}
+
+def run_faces_emotions(cfg: dict = None, atividades=None):
+    """
+    Executa o Step A com a configuração dada (padrão: criar_config()).
+    `atividades` (AnalisadorAtividades do Step B) liga o passo único: a pose roda sobre
+    os mesmos frames decodificados e o resumo do Step B é gravado no fim.
+    """
+    cfg = cfg or criar_config()
     garantir_diretorio("outputs")
 
-    known_encodings, known_names = carregar_banco_faces(cfg["PASTA_FACES_CONHECIDAS"])
+    indice_faces, known_names = carregar_banco_faces(cfg["PASTA_FACES_CONHECIDAS"], cfg["CACHE_BANCO_FACES"])
+    # import do DeepFace/TF + carga dos pesos em paralelo com a abertura do vídeo e do escritor
+    aquecimento = iniciar_thread(_aquecer_modelos, cfg, indice_faces, known_names) if cfg["AQUECER_MODELOS"] else None
 
     print(f"🚀 Iniciando leitura otimizada do vídeo: {cfg['VIDEO_ENTRADA']}")
-    cap_thread = FileVideoStream(cfg["VIDEO_ENTRADA"]).start()
-    time.sleep(1.0)
+    passo_leitura = cfg["FRAME_STEP"] if cfg["SO_FRAMES_AMOSTRADOS"] else 1
+    cap_thread = LEITORES[cfg["LEITOR"]](cfg, passo_leitura).start()
 
     info = ler_metadados_video(cap_thread)
-    escritor = criar_video_writer(cfg["VIDEO_SAIDA"], info["fps"], info["largura"], info["altura"])
+    # codificação em thread própria: desenho/reordenação não esperam o encoder
+    escritor = EscritorVideoAssincrono(
+        criar_video_writer(
+            cfg["VIDEO_SAIDA"], info["fps"] / passo_leitura, info["largura"], info["altura"], cfg["BACKEND_VIDEO"],
+            cfg["H264_HARDWARE"],
+        )
+    ) if cfg["ESCREVER_VIDEO"] else None
 
     limiares = {
         "MIN_AREA_FACE": 40 * 40,
@@ -66,149 +660,90 @@ def run_faces_emotions():
         "MIN_CONFIANCA": 0.00,
     }
 
-    auto = AutoajusteLimiar(cfg["FRAMES_WARMUP_ANALISADOS"], info["area_frame"], cfg["DEBUG"])
-    historico_ids = deque(maxlen=10)
-    contador_emocoes = Counter()
-
-    frames_analisados = 0
-    total_faces = 0
-    faces_ultimo_frame = []
-
-    barra = tqdm(total=info["total_frames"] if info["total_frames"] > 0 else None, desc="Passo A (Otimizado)")
-    indice_frame = 0
-    debug_prints = 0
-
-    while cap_thread.more():
-        ret, frame = cap_thread.read()
-
-        if not ret:
-            if not cap_thread.stopped:
-                time.sleep(0.01)
-                continue
-            break
-
-        if frame is None:
-            break
-
-        analisou_este_frame = False
-
-        if indice_frame % cfg["FRAME_STEP"] == 0:
-            try:
-                SCALE = cfg["SCALE_DETECCAO"]
-
-                # detecta no frame reduzido (mais rápido)
-                frame_small = cv2.resize(
-                    frame, (0, 0),
-                    fx=SCALE, fy=SCALE,
-                    interpolation=cv2.INTER_AREA
-                )
-
-                faces_detectadas = detectar_faces(
-                    frame_bgr=frame_small,
-                    detector_backend=cfg["DETECTOR_BACKEND"],
-                    enforce_detection=cfg["ENFORCE_DETECTION"]
-                )
-
-                if cfg["DEBUG"] and debug_prints < cfg["DEBUG_MAX_FRAMES"]:
-                    print(f"[DEBUG] frame={indice_frame} | faces={len(faces_detectadas)} | backend={cfg['DETECTOR_BACKEND']} | scale={SCALE}")
-                    debug_prints += 1
-
-                faces_validas = []
-                H, W = frame.shape[:2]
-
-                for face_dict in faces_detectadas:
-                    dados = extrair_bbox_e_confianca(face_dict)
-
-                    # bbox no frame reduzido
-                    xs, ys, ws, hs = dados["x"], dados["y"], dados["w"], dados["h"]
-                    if ws <= 0 or hs <= 0:
-                        continue
-
-                    # reprojeção para frame original
-                    x = int(xs / SCALE)
-                    y = int(ys / SCALE)
-                    w = int(ws / SCALE)
-                    h = int(hs / SCALE)
-
-                    # clamp
-                    x = max(0, min(x, W - 1))
-                    y = max(0, min(y, H - 1))
-                    w = max(1, min(w, W - x))
-                    h = max(1, min(h, H - y))
-
-                    area, ar = calcular_area_e_ar(w, h)
-
-                    # autoajuste (warm-up)
-                    if not auto.limiares_definidos:
-                        auto.adicionar_amostra(area, ar, dados["tem_confianca"], dados["confianca"])
-                        if auto.pronto_para_definir():
-                            limiares = auto.definir_limiares(limiares)
-
-                    # filtros
-                    if not passa_filtros_geometricos(area, ar, limiares):
-                        continue
-                    if not passa_filtro_confianca(dados["tem_confianca"], dados["confianca"], limiares):
-                        continue
-                    if not passa_persistencia(historico_ids, x, y, cfg["TAMANHO_GRID"], cfg["K_PERSISTENCIA"]):
-                        continue
-
-                    # recorte no frame original (melhor p/ emoção e identidade)
-                    face_crop = recortar_rosto(frame, x, y, w, h, info["largura"], info["altura"], cfg["PAD_RATIO"])
-
-                    # emoção
-                    res_emocao = analisar_emocao(face_crop)
-                    if not res_emocao:
-                        if cfg["DEBUG"] and debug_prints < cfg["DEBUG_MAX_FRAMES"]:
-                            print("[DEBUG] emoção falhou para um face_crop")
-                            debug_prints += 1
-                        continue
-
-                    emocao = res_emocao.get("dominant_emotion", "unknown")
-
-                    # identidade
-                    nome = "Desconhecido"
-                    if known_encodings:
-                        nome = reconhecer_identidade(face_crop, known_encodings, known_names)
-
-                    faces_validas.append({
-                        "x": x, "y": y, "w": w, "h": h,
-                        "emocao": emocao,
-                        "nome": nome
-                    })
-
-                faces_ultimo_frame = faces_validas
-                frames_analisados += 1
-                analisou_este_frame = True
-
-            except Exception as e:
-                faces_ultimo_frame = []
-                if cfg["DEBUG"]:
-                    print(f"Erro frame {indice_frame}: {e}")
-
-        # desenha e grava
-        desenhar_anotacoes(frame, faces_ultimo_frame, info["largura"], info["altura"])
+    # estado compartilhado entre os estágios
+    # (autoajuste/histórico só são tocados pela detecção; contadores só pela escrita)
+    falha = FalhaPipeline()
+    estado = {
+        "falha": falha,
+        "passo_leitura": passo_leitura,
+        "auto": AutoajusteLimiar(
+            cfg["FRAMES_WARMUP_ANALISADOS"], info["area_frame"], cfg["DEBUG"], cfg["ESTIMADOR_AUTOAJUSTE"]
+        ),
+        "limiares": limiares,
+        "historico_ids": HistoricoIds(maxlen=10),
+        "registro_faces": RegistroFaces(known_names),
+        "frames_analisados": 0,
+        "total_faces": 0,
+        "buffer_deteccao": None,
+        "luma_anterior": None,
+        "opencl": cfg["USAR_OPENCL"] and cv2.ocl.haveOpenCL(),
+        "debug_prints": 0,
+        "rastreio": None,
+        "lock_debug": threading.Lock(),
+        "cache_emocao": CacheGrade(cfg["TAMANHO_GRID"], cfg["CACHE_EMOCAO_FRAMES"], cfg["CACHE_CAPACIDADE"]),
+        "cache_identidade": CacheGrade(cfg["TAMANHO_GRID"], cfg["CACHE_IDENTIDADE_FRAMES"], cfg["CACHE_CAPACIDADE"]),
+    }
 
-        if analisou_este_frame:
-            total_faces += len(faces_ultimo_frame)
-            for f in faces_ultimo_frame:
-                contador_emocoes[f["emocao"]] += 1
-
-        escritor.write(frame)
-        indice_frame += 1
-        barra.update(1)
+    total_barra = -(-info["total_frames"] // passo_leitura)
+    barra = tqdm(total=total_barra if total_barra > 0 else None, desc="Passo A (Pipeline)")
+
+    # OpenCV usa um pool global de threads; com vários estágios em paralelo,
+    # 1 thread por chamada evita oversubscription dos núcleos
+    cv2.setNumThreads(1)
+    cv2.ocl.setUseOpenCL(estado["opencl"])
+
+    if aquecimento is not None:
+        aquecimento.join()
+
+    n_emocao = cfg["WORKERS_EMOCAO"]
+    fila_deteccao = queue.Queue(maxsize=cfg["TAMANHO_FILA"])
+    fila_emocao = queue.Queue(maxsize=cfg["TAMANHO_FILA"])
+    fila_identidade = queue.Queue(maxsize=cfg["TAMANHO_FILA"])
+
+    threads = [
+        iniciar_thread(_worker_deteccao, cap_thread, fila_deteccao, cfg, info, estado),
+        *[
+            iniciar_thread(
+                executar_estagio_em_lote,
+                lambda itens: _processar_emocao(itens, cfg, estado),
+                fila_deteccao, fila_emocao, cfg["LOTE_EMOCAO_FRAMES"], 1, cfg["ESPERA_LOTE_EMOCAO"], falha,
+            )
+            for _ in range(n_emocao)
+        ],
+        iniciar_thread(
+            executar_estagio,
+            lambda item: _processar_identidade(item, cfg, estado, indice_faces, known_names),
+            fila_emocao, fila_identidade, n_emocao, falha,
+        ),
+        iniciar_thread(_worker_escrita, fila_identidade, escritor, cfg, info, estado, barra, atividades),
+    ]
+    for t in threads:
+        t.join()
 
     barra.close()
     cap_thread.release()
-    escritor.release()
-
+    if escritor is not None:
+        try:
+            escritor.release()
+        except Exception as e:
+            falha.registrar(e)
+    if falha.ativa and atividades is not None:
+        atividades.fechar()  # sem resumo do Step B, mas o detector de pose não fica aberto
+    # qualquer erro de estágio (leitura, detecção, emoção, identidade, escrita, atividades) sobe daqui
+    falha.relancar()
+
+    if atividades is not None:
+        atividades.finalizar(info)
+
+    estado["registro_faces"].salvar(cfg["LOG_FACES_SAIDA"])
     escrever_resumo(cfg["RESUMO_SAIDA"], {
         "video": cfg["VIDEO_ENTRADA"],
-        "total_faces": total_faces,
-        "contador_emocoes": contador_emocoes,
+        "total_faces": estado["total_faces"],
+        "contador_emocoes": estado["registro_faces"].contador_emocoes(),
         "frames_totais": info["total_frames"],
-        "frames_analisados": frames_analisados,
+        "frames_analisados": estado["frames_analisados"],
         "frame_step": cfg["FRAME_STEP"],
-        "limiares": limiares,
+        "limiares": estado["limiares"],
         "k_persistencia": cfg["K_PERSISTENCIA"],
         "tamanho_grid": cfg["TAMANHO_GRID"],
     })
@@ -1,10 +1,16 @@
-import cv2
 import os
+if __name__ == "__main__":
+    # só quando executado como script (ponto de entrada): BLAS/OpenMP com 1 thread por chamada,
+    # antes do import do numpy/cv2/TF. Importado como módulo, quem decide é o chamador (run_pipeline.py)
+    for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(_var, "1")
+
+import cv2
 from collections import Counter
 from tqdm import tqdm
 
 # Importa utilitários do Step A (para abrir vídeo/writer)
-from utils_step_a import abrir_video, ler_metadados_video, criar_video_writer, garantir_diretorio, escrever_resumo
+from utils_step_a import FileVideoStream, LeitorSincrono, ler_metadados_video, criar_video_writer, EscritorVideoAssincrono, garantir_diretorio
 
 # Importa utilitários do Step B (lógica das poses)
 from utils_step_b import iniciar_pose, classificar_atividade, desenhar_esqueleto, desenhar_atividade
@@ -18,14 +24,86 @@ def criar_config_b():
         "VIDEO_ENTRADA": "outputs/stepA_annotated.mp4", 
         "VIDEO_SAIDA": "outputs/stepB_final.mp4",
         "RESUMO_SAIDA": "outputs/stepB_summary.txt",
-        "FRAME_STEP": 1 
+        # pose a cada FRAME_STEP frames; nos demais reaproveita o último resultado
+        "FRAME_STEP": 1,
+        # True = frames não amostrados só passam por grab() (sem decodificar para BGR)
+        # e o vídeo de saída fica só com os amostrados (fps / FRAME_STEP)
+        "SO_FRAMES_AMOSTRADOS": False,
+        # mesmo significado do BACKEND_VIDEO do Step A; "ffmpeg" codifica em H.264 pelo
+        # executável ffmpeg (pipe, NVENC se houver) em vez do mp4v do cv2.VideoWriter
+        "BACKEND_VIDEO": "opencv",
+        # mesmo significado do H264_HARDWARE do Step A
+        "H264_HARDWARE": False,
+        # decodificação em thread própria (sobrepõe com a pose); False = lê na thread principal
+        "LEITURA_EM_THREAD": True,
+        "TAMANHO_FILA_LEITURA": 64,
     }
 
+# ============================================================
+# ANÁLISE DE ATIVIDADES (POSE POR FRAME)
+# ============================================================
+class AnalisadorAtividades:
+    """
+    Pose + classificação da atividade frame a frame, com a contagem do resumo.
+    Usado pelo laço do Step B e, no passo único (run_pipeline), pelo escritor do Step A
+    sobre os mesmos frames decodificados (sem o vídeo intermediário).
+    A pose roda 1 a cada `passo` frames; nos demais reaproveita o último resultado.
+    """
+    def __init__(self, cfg: dict, passo: int = None):
+        self.cfg = cfg
+        self.passo = max(1, int(cfg["FRAME_STEP"] if passo is None else passo))
+        self.pose_detector = iniciar_pose()
+        self.contador = Counter()
+        self.indice_frame = 0
+        self.results = None
+        self.frame_rgb = None  # buffer RGB reaproveitado entre frames (mesmo tamanho)
+        self.atividade = "Nenhuma pessoa detectada"
+
+    def analisar(self, frame):
+        """Atualiza pose/atividade (frames amostrados) e conta a atividade do frame."""
+        amostrado = self.indice_frame % self.passo == 0
+        self.indice_frame += 1
+
+        if amostrado:
+            # Converte para RGB (MediaPipe usa RGB, OpenCV usa BGR) no mesmo buffer de sempre;
+            # somente leitura → o MediaPipe não precisa copiar a imagem
+            if self.frame_rgb is not None:
+                self.frame_rgb.flags.writeable = True
+            self.frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.frame_rgb)
+            self.frame_rgb.flags.writeable = False
+
+            # Processa Pose
+            self.results = self.pose_detector.process(self.frame_rgb)
+
+            self.atividade = "Nenhuma pessoa detectada"
+            if self.results.pose_landmarks:
+                self.atividade = classificar_atividade(self.results.pose_landmarks.landmark)
+
+        if self.results.pose_landmarks:
+            self.contador[self.atividade] += 1
+
+    def desenhar(self, frame):
+        """Esqueleto (o do último frame amostrado) + nome da atividade."""
+        if self.results.pose_landmarks:
+            desenhar_esqueleto(frame, self.results)
+        desenhar_atividade(frame, self.atividade)
+
+    def fechar(self):
+        """Libera o detector de pose (pode ser chamado mais de uma vez)."""
+        if self.pose_detector is not None:
+            self.pose_detector.close()
+            self.pose_detector = None
+
+    def finalizar(self, info: dict):
+        self.fechar()
+        escrever_resumo_b(self.cfg["RESUMO_SAIDA"], self.contador, info, self.indice_frame)
+
 # ============================================================
 # FUNÇÃO PRINCIPAL (QUE ESTAVA FALTANDO)
 # ============================================================
-def run_activities():
-    cfg = criar_config_b()
+def run_activities(cfg: dict = None):
+    """Executa o Step B com a configuração dada (padrão: criar_config_b())."""
+    cfg = cfg or criar_config_b()
     
     if not os.path.exists(cfg["VIDEO_ENTRADA"]):
         print(f"❌ Erro: Saída do Step A não encontrada ({cfg['VIDEO_ENTRADA']}). Rode o Step A primeiro.")
@@ -33,69 +111,67 @@ def run_activities():
 
     garantir_diretorio("outputs")
 
-    # Inicializa Pose Detector
-    pose_detector = iniciar_pose()
-
-    # Abre vídeo
-    cap = abrir_video(cfg["VIDEO_ENTRADA"])
+    passo = max(1, int(cfg["FRAME_STEP"]))
+    so_amostrados = cfg["SO_FRAMES_AMOSTRADOS"] and passo > 1
+    # só amostrados: o próprio leitor avança os demais com grab()
+    passo_leitura = passo if so_amostrados else 1
+
+    # Inicializa Pose Detector (com o leitor pulando frames, todo frame lido é amostrado)
+    analisador = AnalisadorAtividades(cfg, 1 if so_amostrados else passo)
+
+    # Abre vídeo (decode → pose → escrita em estágios sobrepostos)
+    if cfg["LEITURA_EM_THREAD"]:
+        cap = FileVideoStream(
+            cfg["VIDEO_ENTRADA"], cfg["TAMANHO_FILA_LEITURA"], cfg["BACKEND_VIDEO"], passo_leitura
+        ).start()
+    else:
+        cap = LeitorSincrono(cfg["VIDEO_ENTRADA"], cfg["BACKEND_VIDEO"], passo_leitura)
     info = ler_metadados_video(cap)
-    
-    # Prepara gravador de vídeo
-    writer = criar_video_writer(cfg["VIDEO_SAIDA"], info["fps"], info["largura"], info["altura"])
 
-    # Contadores
-    contador_atividades = Counter()
-    total_frames = info["total_frames"]
-    
-    barra = tqdm(total=total_frames, desc="Passo B — Detecção de Atividades")
+    # Prepara gravador de vídeo (codificação em thread separada, não bloqueia a pose)
+    writer = EscritorVideoAssincrono(
+        criar_video_writer(
+            cfg["VIDEO_SAIDA"], info["fps"] / passo_leitura, info["largura"], info["altura"], cfg["BACKEND_VIDEO"],
+            cfg["H264_HARDWARE"],
+        )
+    )
+
+    barra = tqdm(total=info["total_frames"], desc="Passo B — Detecção de Atividades")
 
     while True:
         ret, frame = cap.read()
         if not ret:
             break
 
-        # Converte para RGB (MediaPipe usa RGB, OpenCV usa BGR)
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Processa Pose
-        results = pose_detector.process(frame_rgb)
-        
-        atividade_atual = "Nenhuma pessoa detectada"
-        
-        if results.pose_landmarks:
-            # 1. Desenha esqueleto
-            desenhar_esqueleto(frame, results)
-            
-            # 2. Classifica atividade
-            atividade_atual = classificar_atividade(results.pose_landmarks.landmark)
-            contador_atividades[atividade_atual] += 1
-        
-        # 3. Escreve no vídeo
-        desenhar_atividade(frame, atividade_atual)
+        analisador.analisar(frame)
+        analisador.desenhar(frame)
 
         # Salva frame
         writer.write(frame)
-        barra.update(1)
+        barra.update(passo_leitura)
 
     # Finaliza
     cap.release()
     writer.release()
-    pose_detector.close()
     barra.close()
 
     # Gera resumo do Step B
-    escrever_resumo_b(cfg["RESUMO_SAIDA"], contador_atividades, info)
+    analisador.finalizar(info)
 
     print("✅ Passo B finalizado com sucesso.")
     print(f"🎥 Vídeo Final: {cfg['VIDEO_SAIDA']}")
 
-def escrever_resumo_b(filepath, contador, info):
+def escrever_resumo_b(filepath, contador, info, frames_analisados):
+    # Total Frames = vídeo de origem; com SO_FRAMES_AMOSTRADOS só os amostrados chegam à análise
+    linhas = [
+        "=== PASSO B — Detecção de Atividades ===\n",
+        f"Total Frames: {info['total_frames']}\n",
+        f"Frames Analisados: {frames_analisados}\n",
+        "Contagem de Atividades:\n",
+    ]
+    linhas.extend(f"- {atv}: {count} frames\n" for atv, count in contador.most_common())
     with open(filepath, "w", encoding="utf-8") as f:
-        f.write("=== PASSO B — Detecção de Atividades ===\n")
-        f.write(f"Total Frames: {info['total_frames']}\n")
-        f.write("Contagem de Atividades:\n")
-        for atv, count in contador.most_common():
-            f.write(f"- {atv}: {count} frames\n")
+        f.write("".join(linhas))
 
 if __name__ == "__main__":
     run_activities()
\ No newline at end of file
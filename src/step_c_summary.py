@@ -1,5 +1,6 @@
+import io
 import os
-import re
+from operator import itemgetter
 
 # ============================================================
 # CONFIGURAÇÕES
@@ -10,6 +11,8 @@ SAIDA_FINAL = "outputs/relatorio_final.txt"
 
 EMOCOES_VALIDAS = {"angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"}
 
+DIGITOS = "0123456789"
+
 
 def garantir_diretorio(caminho_arquivo: str) -> None:
     """Garante que o diretório de saída existe."""
@@ -27,6 +30,43 @@ def ler_arquivo(caminho: str) -> str:
         return f.read()
 
 
+# ============================================================
+# PARSING DAS LINHAS "chave: valor" (sem regex)
+# ============================================================
+def separar_inteiro(texto: str):
+    """'  12 frames' → (12, 'frames'); (None, texto) se não começa com dígitos."""
+    texto = texto.lstrip()
+    resto = texto.lstrip(DIGITOS)
+    n = len(texto) - len(resto)
+    return (int(texto[:n]), resto.lstrip()) if n else (None, texto)
+
+
+def extrair_metadados(texto: str, chaves) -> dict:
+    """Primeiro inteiro de cada linha 'chave: N' (None quando a chave não aparece)."""
+    meta = dict.fromkeys(chaves)
+    for linha in texto.splitlines():
+        chave, sep, valor = linha.partition(":")
+        chave = chave.strip()
+        if sep and chave in meta and meta[chave] is None:
+            meta[chave] = separar_inteiro(valor)[0]
+    return meta
+
+
+def separar_item(linha: str):
+    """
+    Linha de lista '- nome: 12 resto' → ('nome', 12, 'resto').
+    None se não começa com '-' ou não há inteiro depois do ':'.
+    """
+    linha = linha.strip()
+    if not linha.startswith("-"):
+        return None
+    nome, sep, valor = linha[1:].partition(":")
+    qtd, resto = separar_inteiro(valor)
+    if not sep or qtd is None:
+        return None
+    return nome.lstrip(), qtd, resto
+
+
 # ============================================================
 # EXTRAÇÃO STEP A
 # ============================================================
@@ -37,15 +77,7 @@ def extrair_meta_a(texto: str) -> dict:
     - frames_analisados
     - frame_step
     """
-    def extrair_int(padrao: str):
-        m = re.search(padrao, texto)
-        return int(m.group(1)) if m else None
-
-    return {
-        "frames_totais": extrair_int(r"frames_totais:\s*(\d+)"),
-        "frames_analisados": extrair_int(r"frames_analisados:\s*(\d+)"),
-        "frame_step": extrair_int(r"frame_step:\s*(\d+)"),
-    }
+    return extrair_metadados(texto, ("frames_totais", "frames_analisados", "frame_step"))
 
 
 def extrair_emocoes_a(texto: str) -> dict:
@@ -64,13 +96,12 @@ def extrair_emocoes_a(texto: str) -> dict:
             idx_inicio = i + 1
             break
 
-    # Se não achou o bloco, faz fallback: pega matches e filtra por emoções válidas
+    # Se não achou o bloco, faz fallback: pega os itens de todas as linhas e filtra por emoções válidas
     if idx_inicio is None:
-        matches = re.findall(r"-\s*([A-Za-z_]+):\s*(\d+)", texto)
-        for k, v in matches:
-            kk = k.strip()
-            if kk in EMOCOES_VALIDAS:
-                emocoes[kk] = int(v)
+        for linha in linhas:
+            item = separar_item(linha)
+            if item and item[0] in EMOCOES_VALIDAS:
+                emocoes[item[0]] = item[1]
         return emocoes
 
     # Lê linhas do bloco até parar (linha vazia ou outro cabeçalho)
@@ -83,12 +114,9 @@ def extrair_emocoes_a(texto: str) -> dict:
         if linha.lower().startswith("limiar") or linha.lower().startswith("k persistencia") or linha.lower().startswith("tamanho grid"):
             break
 
-        m = re.match(r"-\s*([A-Za-z_]+):\s*(\d+)", linha)
-        if m:
-            emocao = m.group(1).strip()
-            qtd = int(m.group(2))
-            if emocao in EMOCOES_VALIDAS:
-                emocoes[emocao] = qtd
+        item = separar_item(linha)
+        if item and item[0] in EMOCOES_VALIDAS:
+            emocoes[item[0]] = item[1]
 
     return emocoes
 
@@ -97,18 +125,26 @@ def extrair_emocoes_a(texto: str) -> dict:
 # EXTRAÇÃO STEP B
 # ============================================================
 def extrair_meta_b(texto: str) -> dict:
-    """Extrai metadados do Step B, principalmente Total Frames."""
-    m = re.search(r"Total Frames:\s*(\d+)", texto)
-    return {"total_frames": int(m.group(1)) if m else None}
+    """
+    Extrai metadados do Step B:
+    - total_frames (vídeo de origem)
+    - frames_analisados (resumos antigos não têm: None)
+    """
+    meta = extrair_metadados(texto, ("Total Frames", "Frames Analisados"))
+    return {"total_frames": meta["Total Frames"], "frames_analisados": meta["Frames Analisados"]}
 
 
 def extrair_atividades_b(texto: str) -> dict:
     """
     Busca linhas como '- Bracos Levantados: 12 frames'.
     """
-    padrao = r"-\s*([\w\s/]+):\s*(\d+)\s*frames"
-    matches = re.findall(padrao, texto)
-    return {atv.strip(): int(qtd) for atv, qtd in matches}
+    atividades = {}
+    for linha in texto.splitlines():
+        item = separar_item(linha)
+        # mesmo critério de nome do antigo padrão [\w\s/]+ (letras, dígitos, espaços, "_" e "/")
+        if item and item[2].startswith("frames") and all(c.isalnum() or c.isspace() or c in "_/" for c in item[0]):
+            atividades[item[0].strip()] = item[1]
+    return atividades
 
 
 # ============================================================
@@ -135,81 +171,92 @@ def gerar_relatorio():
     # 3. Regra de Negócio (Anomalia)
     qtd_anomalias = atividades.get("Bracos Levantados", 0)
 
-    # 4. Construção do Texto Final
-    relatorio = []
-    relatorio.append("========================================")
-    relatorio.append("   RELATÓRIO FINAL - TECH CHALLENGE 4   ")
-    relatorio.append("========================================\n")
+    # 4. Construção do Texto Final (direto num buffer de texto, sem lista + join)
+    relatorio = io.StringIO()
+
+    def linha(texto: str = "") -> None:
+        relatorio.write(texto)
+        relatorio.write("\n")
+
+    linha("========================================")
+    linha("   RELATÓRIO FINAL - TECH CHALLENGE 4   ")
+    linha("========================================\n")
 
     # ---- CONTEXTO DE PROCESSAMENTO (NOVO) ----
     total_video = meta_a.get("frames_totais") or meta_b.get("total_frames")
     frames_a = meta_a.get("frames_analisados")
     frame_step = meta_a.get("frame_step")
-    frames_b = meta_b.get("total_frames")
+    frames_b = meta_b.get("frames_analisados")
+    if frames_b is None:
+        frames_b = meta_b.get("total_frames")  # resumo sem a linha (versão anterior): todos os frames
 
-    relatorio.append("📊 CONTEXTO DE PROCESSAMENTO\n")
+    linha("📊 CONTEXTO DE PROCESSAMENTO\n")
 
     if total_video is not None:
-        relatorio.append(f"- Total de frames do vídeo: {total_video}\n")
+        linha(f"- Total de frames do vídeo: {total_video}\n")
     else:
-        relatorio.append("- Total de frames do vídeo: (não encontrado)\n")
+        linha("- Total de frames do vídeo: (não encontrado)\n")
 
-    relatorio.append("Step A — Emoções e Faces:")
+    linha("Step A — Emoções e Faces:")
     if frames_a is not None:
-        relatorio.append(f"- Frames analisados: {frames_a}")
+        linha(f"- Frames analisados: {frames_a}")
     else:
-        relatorio.append("- Frames analisados: (não encontrado)")
+        linha("- Frames analisados: (não encontrado)")
 
     if frame_step is not None:
-        relatorio.append(f"- Estratégia: amostragem temporal (1 a cada {frame_step} frames)\n")
+        linha(f"- Estratégia: amostragem temporal (1 a cada {frame_step} frames)\n")
     else:
-        relatorio.append("- Estratégia: amostragem temporal (frame_step não encontrado)\n")
+        linha("- Estratégia: amostragem temporal (frame_step não encontrado)\n")
 
-    relatorio.append("Step B — Atividades Corporais:")
+    linha("Step B — Atividades Corporais:")
     if frames_b is not None:
-        relatorio.append(f"- Frames analisados: {frames_b}")
+        linha(f"- Frames analisados: {frames_b}")
+    else:
+        linha("- Frames analisados: (não encontrado)")
+    total_b = meta_b.get("total_frames")
+    if frames_b is not None and total_b and frames_b < total_b:
+        linha(f"- Estratégia: só os frames amostrados ({frames_b} de {total_b})\n")
     else:
-        relatorio.append("- Frames analisados: (não encontrado)")
-    relatorio.append("- Estratégia: análise frame a frame\n")
+        linha("- Estratégia: análise frame a frame\n")
 
     # ---- RESUMO EXECUTIVO ----
-    relatorio.append("1. RESUMO EXECUTIVO")
-    relatorio.append("-------------------")
-    relatorio.append("O vídeo foi processado para análise comportamental e emocional.")
+    linha("1. RESUMO EXECUTIVO")
+    linha("-------------------")
+    linha("O vídeo foi processado para análise comportamental e emocional.")
 
     if qtd_anomalias > 0:
-        relatorio.append(
+        linha(
             f"⚠️ ALERTA: Foram detectadas {qtd_anomalias} ocorrências de anomalia (Gestos Bruscos/Braços Levantados)."
         )
-        relatorio.append("Recomenda-se revisão humana nesses trechos.\n")
+        linha("Recomenda-se revisão humana nesses trechos.\n")
     else:
-        relatorio.append("✅ Nenhuma anomalia grave detectada.\n")
+        linha("✅ Nenhuma anomalia grave detectada.\n")
 
     # ---- STEP B ----
-    relatorio.append("2. ANÁLISE DE ATIVIDADES (STEP B)")
-    relatorio.append("---------------------------------")
+    linha("2. ANÁLISE DE ATIVIDADES (STEP B)")
+    linha("---------------------------------")
     for atv, qtd in atividades.items():
-        relatorio.append(f"- {atv}: {qtd} frames")
-    relatorio.append("")
+        linha(f"- {atv}: {qtd} frames")
+    linha("")
 
     # ---- STEP A ----
-    relatorio.append("3. ANÁLISE EMOCIONAL (STEP A)")
-    relatorio.append("-----------------------------")
-    relatorio.append("Distribuição das emoções detectadas nos rostos:")
+    linha("3. ANÁLISE EMOCIONAL (STEP A)")
+    linha("-----------------------------")
+    linha("Distribuição das emoções detectadas nos rostos:")
 
     if emocoes:
-        emocoes_ordenadas = sorted(emocoes.items(), key=lambda x: x[1], reverse=True)
+        emocoes_ordenadas = sorted(emocoes.items(), key=itemgetter(1), reverse=True)
         for emo, qtd in emocoes_ordenadas:
-            relatorio.append(f"- {emo}: {qtd}")
+            linha(f"- {emo}: {qtd}")
     else:
-        relatorio.append("- (nenhuma emoção encontrada no resumo do Step A)")
+        linha("- (nenhuma emoção encontrada no resumo do Step A)")
 
-    relatorio.append("\n========================================")
-    relatorio.append("Gerado automaticamente pelo Pipeline IADT.")
+    linha("\n========================================")
+    linha("Gerado automaticamente pelo Pipeline IADT.")
 
     # 5. Salvar em arquivo
     garantir_diretorio(SAIDA_FINAL)
-    texto_completo = "\n".join(relatorio)
+    texto_completo = relatorio.getvalue()[:-1]  # sem a quebra de linha final
     with open(SAIDA_FINAL, "w", encoding="utf-8") as f:
         f.write(texto_completo)
 
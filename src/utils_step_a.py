@@ -1,17 +1,100 @@
 import os
+import shutil
+import subprocess
+from collections import Counter, OrderedDict, deque
+from fractions import Fraction
 import cv2
 import numpy as np
-from deepface import DeepFace
-import face_recognition
-import re
-from threading import Thread
+import importlib
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import sys
+from threading import Thread, Lock, RLock, Event, local
 import queue
 import time
 
+try:
+    from numba import njit
+    NUMBA_DISPONIVEL = True
+except ImportError:
+    # numba é opcional: sem ele os kernels rodam como Python puro
+    # (ou trocam para uma alternativa equivalente, escolhida na importação)
+    NUMBA_DISPONIVEL = False
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda funcao: funcao
+
+try:
+    import faiss
+except ImportError:
+    # faiss é opcional: só compensa em galerias grandes (ver GALERIA_MIN_FAISS)
+    faiss = None
+
 
 # ============================================================
 # COMPATIBILIDADE (STEP B)
 # ============================================================
+def abrir_captura_opencv(caminho: str) -> cv2.VideoCapture:
+    """
+    VideoCapture no backend FFmpeg pedindo decodificação por hardware (VAAPI/NVDEC/
+    VideoToolbox/D3D11, o que existir); se não abrir assim, cai para o backend padrão.
+    """
+    try:
+        cap = cv2.VideoCapture(
+            caminho, cv2.CAP_FFMPEG,
+            [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY],
+        )
+        if cap.isOpened():
+            return cap
+    except (AttributeError, cv2.error):
+        pass
+    return cv2.VideoCapture(caminho)
+
+def dimensoes_reduzidas(largura: int, altura: int, largura_max: int):
+    """(largura, altura) limitadas a largura_max mantendo a proporção (pares, p/ yuv420p); só reduz."""
+    if not largura_max or largura <= largura_max:
+        return largura, altura
+    return largura_max - largura_max % 2, max(2, int(round(altura * largura_max / largura / 2)) * 2)
+
+class CapturaRedimensionada:
+    """
+    cv2.VideoCapture com os frames entregues já reduzidos (LARGURA_MAX_DECODIFICACAO).
+    O FFmpeg do OpenCV não escala na decodificação: o resize é feito logo após o read(),
+    uma vez por frame lido; grab()/set() (frames pulados) passam direto.
+    """
+    def __init__(self, cap, largura_max: int):
+        self.cap = cap
+        self.largura, self.altura = dimensoes_reduzidas(
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), largura_max
+        )
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def read(self):
+        ok, frame = self.cap.read()
+        if not ok:
+            return False, None
+        return True, cv2.resize(frame, (self.largura, self.altura), interpolation=cv2.INTER_AREA)
+
+    def grab(self) -> bool:
+        return self.cap.grab()
+
+    def set(self, prop_id, valor):
+        return self.cap.set(prop_id, valor)
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.largura
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.altura
+        return self.cap.get(prop_id)
+
+    def release(self):
+        self.cap.release()
+
 def abrir_video(caminho: str) -> cv2.VideoCapture:
     """
     Abre um vídeo via OpenCV (usado no Step B).
@@ -20,31 +103,392 @@ def abrir_video(caminho: str) -> cv2.VideoCapture:
     if not os.path.exists(caminho):
         raise FileNotFoundError(f"Vídeo não encontrado: {caminho}")
 
-    cap = cv2.VideoCapture(caminho)
+    cap = abrir_captura_opencv(caminho)
     if not cap.isOpened():
         raise RuntimeError(f"Não foi possível abrir o vídeo: {caminho}")
 
     return cap
 
 
+# ============================================================
+# BACKEND PyAV (FFmpeg direto, opcional)
+# ============================================================
+class CapturaPyAV:
+    """
+    Decodificação via PyAV com a mesma interface usada do cv2.VideoCapture
+    (read/get/isOpened/release). Tenta decodificar na GPU (hwaccel CUDA) e
+    cai para o decoder de software multithread quando não há aceleração.
+    A conversão YUV→BGR fica no libswscale, sem passar pelo OpenCV; com largura_max,
+    a redução de resolução acontece nessa mesma passada.
+    """
+    def __init__(self, path: str, hwaccel: str = "cuda", largura_max: int = 0):
+        import av  # opcional: só necessário com BACKEND_VIDEO="pyav"
+
+        self.container = None
+        if hwaccel:
+            try:
+                from av.codec.hwaccel import HWAccel
+                self.container = av.open(path, hwaccel=HWAccel(device_type=hwaccel, allow_software_fallback=True))
+            except Exception:
+                self.container = None
+        if self.container is None:
+            self.container = av.open(path)
+
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        self.frames = self.container.decode(self.stream)
+
+        self.fps = float(self.stream.average_rate or 30.0)
+        self.width, self.height = dimensoes_reduzidas(
+            self.stream.codec_context.width, self.stream.codec_context.height, largura_max
+        )
+        self.total_frames = self.stream.frames or 0
+
+    def isOpened(self) -> bool:
+        return self.container is not None
+
+    def read(self):
+        frame = next(self.frames, None)
+        if frame is None:
+            return False, None
+        if frame.width != self.width:
+            frame = frame.reformat(width=self.width, height=self.height, format="bgr24")
+        return True, frame.to_ndarray(format="bgr24")
+
+    def grab(self) -> bool:
+        # avança um frame sem convertê-lo para BGR
+        return next(self.frames, None) is not None
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return self.total_frames
+        return 0
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+class EscritorPyAV:
+    """
+    Codificação H.264 via PyAV com a interface do cv2.VideoWriter (write/release).
+    Usa o primeiro encoder disponível em CODECS_PYAV (NVENC na GPU antes do libx264).
+    """
+    CODECS_PYAV = ("h264_nvenc", "libx264", "mpeg4")
+
+    def __init__(self, caminho_saida: str, fps: float, largura: int, altura: int):
+        import av
+
+        self.av = av
+        codec = next((c for c in self.CODECS_PYAV if self._encoder_disponivel(c, largura, altura)), None)
+        if codec is None:
+            raise RuntimeError("Nenhum encoder H.264/MPEG-4 disponível no PyAV.")
+
+        self.container = av.open(caminho_saida, mode="w")
+        self.stream = self.container.add_stream(codec, rate=Fraction(fps).limit_denominator(1001))
+        self.stream.width, self.stream.height, self.stream.pix_fmt = largura, altura, "yuv420p"
+
+    def _encoder_disponivel(self, codec: str, largura: int, altura: int) -> bool:
+        # abre um contexto avulso: o encoder pode existir no build e falhar sem GPU/driver
+        try:
+            ctx = self.av.CodecContext.create(codec, "w")
+            ctx.width, ctx.height, ctx.pix_fmt = largura, altura, "yuv420p"
+            ctx.time_base = Fraction(1, 30)
+            ctx.open()
+            return True
+        except Exception:
+            return False
+
+    def write(self, frame):
+        quadro = self.av.VideoFrame.from_ndarray(frame, format="bgr24")
+        for pacote in self.stream.encode(quadro):
+            self.container.mux(pacote)
+
+    def release(self):
+        for pacote in self.stream.encode():
+            self.container.mux(pacote)
+        self.container.close()
+
+
+# ============================================================
+# BACKEND cv2.cudacodec (NVDEC/NVENC, opcional)
+# ============================================================
+class CapturaCudaCodec:
+    """
+    Decodificação no NVDEC via cv2.cudacodec (OpenCV compilado com CUDA + Video Codec SDK),
+    com a interface do cv2.VideoCapture. A conversão para BGR roda na GPU; só o frame
+    final é baixado para a CPU, onde detecção, crops e desenho trabalham. Com largura_max,
+    o próprio NVDEC entrega o frame reduzido (targetSz), e o download fica menor.
+    """
+    def __init__(self, path: str, largura_max: int = 0):
+        # metadados (fps, total de frames) pelo container, sem decodificar
+        sonda = cv2.VideoCapture(path)
+        self.fps = float(sonda.get(cv2.CAP_PROP_FPS)) or 30.0
+        self.total_frames = int(sonda.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+        self.width = int(sonda.get(cv2.CAP_PROP_FRAME_WIDTH)) or 0
+        self.height = int(sonda.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 0
+        sonda.release()
+
+        largura, altura = dimensoes_reduzidas(self.width, self.height, largura_max)
+        if (largura, altura) != (self.width, self.height):
+            params = cv2.cudacodec.VideoReaderInitParams()
+            params.targetSz = (largura, altura)
+            self.width, self.height = largura, altura
+            self.reader = cv2.cudacodec.createVideoReader(path, params=params)
+        else:
+            self.reader = cv2.cudacodec.createVideoReader(path)
+        self.reader.set(cv2.cudacodec.ColorFormat_BGR)
+
+    def isOpened(self) -> bool:
+        return self.reader is not None
+
+    def read(self):
+        ok, frame_gpu = self.reader.nextFrame()
+        if not ok:
+            return False, None
+        return True, frame_gpu.download()
+
+    def grab(self) -> bool:
+        return self.reader.grab()
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return self.total_frames
+        return 0
+
+    def release(self):
+        self.reader = None
+
+class EscritorCudaCodec:
+    """Codificação H.264 no NVENC via cv2.cudacodec, com a interface do cv2.VideoWriter."""
+    def __init__(self, caminho_saida: str, fps: float, largura: int, altura: int):
+        self.escritor = cv2.cudacodec.createVideoWriter(
+            caminho_saida, (largura, altura), codec=cv2.cudacodec.H264, fps=fps,
+            colorFormat=cv2.cudacodec.ColorFormat_BGR,
+        )
+        self.frame_gpu = cv2.cuda_GpuMat()
+
+    def write(self, frame):
+        self.frame_gpu.upload(frame)  # reaproveita a mesma área na GPU
+        self.escritor.write(self.frame_gpu)
+
+    def release(self):
+        self.escritor.release()
+
+def abrir_captura(path: str, backend: str = "opencv", largura_max: int = 0):
+    """
+    Captura conforme BACKEND_VIDEO: "opencv", "pyav" ou "cudacodec" ("ffmpeg" só muda o escritor).
+    largura_max > 0 entrega frames reduzidos a essa largura (0 = resolução original).
+    """
+    if backend == "pyav":
+        return CapturaPyAV(path, largura_max=largura_max)
+    if backend == "cudacodec":
+        return CapturaCudaCodec(path, largura_max)
+    cap = abrir_captura_opencv(path)
+    if largura_max and cap.isOpened() and int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) > largura_max:
+        return CapturaRedimensionada(cap, largura_max)
+    return cap
+
+
+
+# ============================================================
+# PULO POR KEYFRAME (SO_FRAMES_AMOSTRADOS com FRAME_STEP grande)
+# ============================================================
+def listar_keyframes(path: str):
+    """
+    Índices (em frames, ordem de apresentação) dos keyframes do vídeo, lidos só dos
+    pacotes do container via PyAV — sem decodificar nada. None se o PyAV não estiver
+    instalado ou o container não informar os timestamps.
+    """
+    try:
+        import av
+    except ImportError:
+        return None
+
+    try:
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            pacotes = [(p.pts, p.is_keyframe) for p in container.demux(stream) if p.pts is not None]
+    except Exception:
+        return None
+    if not pacotes:
+        return None
+
+    pacotes.sort()
+    return np.array([i for i, (_, chave) in enumerate(pacotes) if chave], dtype=np.int64)
+
+class PuloKeyframe:
+    """
+    Avança o cv2.VideoCapture por n frames. Quando há um keyframe entre a posição
+    atual e o alvo, um seek (CAP_PROP_POS_FRAMES) faz o decoder recomeçar nele em vez
+    de decodificar todos os frames do GOP anterior; caso contrário, grab() um a um.
+    Só compensa quando frame_step >= GOP típico: com GOPs mais longos que o passo, o
+    seek do OpenCV recomeça antes do keyframe e sai mais caro que os grab(); nesse caso
+    (ou sem a lista de keyframes) fica o avanço com grab().
+    """
+    MIN_FRAMES_SEEK = 8  # abaixo disso grab() sai mais barato que o seek
+
+    def __init__(self, path: str, frame_step: int):
+        self.keyframes = listar_keyframes(path) if frame_step > 1 else None
+        if self.keyframes is not None and (len(self.keyframes) < 2 or np.median(np.diff(self.keyframes)) > frame_step):
+            self.keyframes = None
+        self.posicao = 0  # índice do próximo frame a ser lido
+
+    def ler(self, stream):
+        grabbed, frame = stream.read()
+        self.posicao += 1
+        return grabbed, frame
+
+    def avancar(self, stream, n: int) -> bool:
+        alvo = self.posicao + n
+        if self.keyframes is not None:
+            i = np.searchsorted(self.keyframes, alvo, side="right") - 1
+            if i >= 0 and self.keyframes[i] - self.posicao >= self.MIN_FRAMES_SEEK:
+                self.posicao = alvo
+                return stream.set(cv2.CAP_PROP_POS_FRAMES, alvo)
+
+        for _ in range(n):
+            if not stream.grab():
+                return False
+            self.posicao += 1
+        return True
+
+
+# ============================================================
+# ESCRITOR FFmpeg (pipe para o executável, opcional)
+# ============================================================
+class EscritorFFmpeg:
+    """
+    Codificação H.264 pelo executável ffmpeg: os frames BGR crus vão pelo stdin
+    e o encode (NVENC quando há GPU, senão libx264) roda em outro processo.
+    Mesma interface do cv2.VideoWriter (write/release).
+    """
+    CODECS_FFMPEG = ("h264_nvenc", "libx264", "mpeg4")
+
+    def __init__(self, caminho_saida: str, fps: float, largura: int, altura: int):
+        self.executavel = shutil.which("ffmpeg")
+        if self.executavel is None:
+            raise RuntimeError("Executável ffmpeg não encontrado no PATH.")
+
+        codec = next((c for c in self.CODECS_FFMPEG if self._encoder_disponivel(c)), None)
+        if codec is None:
+            raise RuntimeError("Nenhum encoder H.264/MPEG-4 disponível no ffmpeg.")
+
+        comando = [
+            self.executavel, "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{largura}x{altura}", "-r", f"{fps:.6f}",
+            "-i", "-", "-c:v", codec, "-pix_fmt", "yuv420p",
+        ]
+        if codec == "h264_nvenc":
+            comando += ["-preset", "p1"]
+        elif codec == "libx264":
+            comando += ["-preset", "veryfast"]
+        self.processo = subprocess.Popen(comando + [caminho_saida], stdin=subprocess.PIPE)
+
+    def _encoder_disponivel(self, codec: str) -> bool:
+        # encode de um quadro sintético: o encoder pode existir no build e falhar sem GPU/driver
+        teste = [
+            self.executavel, "-hide_banner", "-loglevel", "error",
+            "-f", "lavfi", "-i", "color=s=64x64:d=0.04", "-c:v", codec, "-f", "null", "-",
+        ]
+        try:
+            return subprocess.run(teste, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            return False
+
+    def write(self, frame):
+        # o frame já é C-contíguo (vem do decoder/desenho); vai direto para o pipe, sem tobytes()
+        self.processo.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        self.processo.stdin.close()
+        self.processo.wait()
+
+# ============================================================
+# FILA SPSC (1 PRODUTOR / 1 CONSUMIDOR)
+# ============================================================
+class FilaSPSC:
+    """
+    Fila limitada para exatamente 1 thread produtora e 1 consumidora, sem lock por item.
+    deque.append/popleft já são atômicos; os Events só são sinalizados na transição
+    vazia→com itens / cheia→com espaço (queue.Queue adquire lock + Condition em todo put/get).
+    Mesma interface usada do queue.Queue: put/get com timeout (queue.Full / queue.Empty) e qsize.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, int(maxsize))
+        self.itens = deque()
+        self.tem_itens = Event()
+        self.tem_espaco = Event()
+        self.tem_espaco.set()
+
+    def put(self, item, timeout: float = None):
+        while len(self.itens) >= self.maxsize:
+            # limpa e confere de novo: um get() entre as duas linhas já teria liberado espaço
+            self.tem_espaco.clear()
+            if len(self.itens) < self.maxsize:
+                break
+            if not self.tem_espaco.wait(timeout):
+                raise queue.Full
+        self.itens.append(item)
+        if not self.tem_itens.is_set():
+            self.tem_itens.set()
+
+    def get(self, timeout: float = None):
+        while True:
+            try:
+                item = self.itens.popleft()
+            except IndexError:
+                self.tem_itens.clear()
+                if self.itens:
+                    continue
+                if not self.tem_itens.wait(timeout):
+                    raise queue.Empty
+                continue
+            if not self.tem_espaco.is_set():
+                self.tem_espaco.set()
+            return item
+
+    def qsize(self) -> int:
+        return len(self.itens)
+
+
 # ============================================================
 # CLASSE DE LEITURA OTIMIZADA (THREADING) — STEP A
 # ============================================================
 class FileVideoStream:
     """
     Lê frames do vídeo em thread separada para reduzir gargalo de I/O.
+    Com frame_step > 1 só 1 a cada frame_step frames é entregue; os demais
+    são apenas avançados com grab() (sem conversão para BGR nem cópia para a fila).
     Uso:
         cap = FileVideoStream("video.mp4").start()
         while cap.more():
             ret, frame = cap.read()
     """
-    def __init__(self, path: str, queue_size: int = 128):
-        self.stream = cv2.VideoCapture(path)
+    def __init__(self, path: str, queue_size: int = 128, backend: str = "opencv", frame_step: int = 1,
+                 pular_keyframes: bool = False, largura_max: int = 0):
+        self.stream = abrir_captura(path, backend, largura_max)
         if not self.stream.isOpened():
             raise FileNotFoundError(f"Não foi possível abrir o vídeo: {path}")
 
         self.stopped = False
-        self.Q = queue.Queue(maxsize=queue_size)
+        self.erro = None  # exceção da thread de leitura
+        self.Q = FilaSPSC(queue_size)
+        self.frame_step = max(1, int(frame_step))
+        # seek por keyframe só com o cv2.VideoCapture (os outros backends não têm set())
+        self.pulo = PuloKeyframe(path, self.frame_step if pular_keyframes and backend == "opencv" else 1)
 
         self.total_frames = int(self.stream.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
         self.fps = float(self.stream.get(cv2.CAP_PROP_FPS)) or 30.0
@@ -58,22 +502,36 @@ class FileVideoStream:
         return self
 
     def update(self):
-        while True:
-            if self.stopped:
-                return
-
-            if not self.Q.full():
-                grabbed, frame = self.stream.read()
+        try:
+            while not self.stopped:
+                grabbed, frame = self.pulo.ler(self.stream)
                 if not grabbed:
+                    break
+
+                # put bloqueante (com timeout só para enxergar release()) em vez de polling com sleep
+                while not self.stopped:
+                    try:
+                        self.Q.put(frame, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+                if self.frame_step > 1 and not self.pulo.avancar(self.stream, self.frame_step - 1):
                     self.stopped = True
-                    return
-                self.Q.put(frame)
-            else:
-                time.sleep(0.01)
+        except Exception as e:
+            self.erro = e  # relançado por read() depois dos frames já enfileirados
+        finally:
+            self.stopped = True
 
     def read(self):
-        if self.more():
-            return True, self.Q.get()
+        # o timeout evita ficar preso em Q.get() se o leitor terminar entre more() e get()
+        while self.more():
+            try:
+                return True, self.Q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        if self.erro is not None:
+            raise self.erro
         return False, None
 
     def more(self):
@@ -96,6 +554,300 @@ class FileVideoStream:
         return 0
 
 
+class LeitorSincrono:
+    """
+    Mesma interface do FileVideoStream (start/read/more/stopped/release/get),
+    mas decodificando na thread de quem chama read(). Útil quando a leitura
+    em thread não compensa (ex.: poucos núcleos, vídeo curto).
+    """
+    def __init__(self, path: str, backend: str = "opencv", frame_step: int = 1, pular_keyframes: bool = False,
+                 largura_max: int = 0):
+        self.stream = abrir_captura(path, backend, largura_max)
+        if not self.stream.isOpened():
+            raise FileNotFoundError(f"Não foi possível abrir o vídeo: {path}")
+        self.stopped = False
+        self.frame_step = max(1, int(frame_step))
+        self.pulo = PuloKeyframe(path, self.frame_step if pular_keyframes and backend == "opencv" else 1)
+
+    def start(self):
+        return self
+
+    def read(self):
+        if self.stopped:
+            return False, None
+        grabbed, frame = self.pulo.ler(self.stream)
+        if not grabbed:
+            self.stopped = True
+            return False, None
+        if self.frame_step > 1 and not self.pulo.avancar(self.stream, self.frame_step - 1):
+            self.stopped = True
+        return True, frame
+
+    def more(self):
+        return not self.stopped
+
+    def release(self):
+        self.stopped = True
+        self.stream.release()
+
+    def get(self, prop_id):
+        return self.stream.get(prop_id)
+
+
+def _decodificar_em_processo(path, backend, frame_step, pular_keyframes, largura_max, n_slots,
+                             conexao, livres, prontos, parar):
+    """
+    Corpo do processo do LeitorProcesso: decodifica com um LeitorSincrono e copia cada
+    frame para o próximo slot livre da memória compartilhada. Manda pela conexão os
+    metadados (ou o erro de abertura) e, no fim, quantos frames produziu (e o erro de
+    leitura, se houve).
+    """
+    try:
+        leitor = LeitorSincrono(path, backend, frame_step, pular_keyframes, largura_max)
+    except Exception as e:
+        conexao.send((None, str(e)))
+        return
+
+    largura = int(leitor.get(cv2.CAP_PROP_FRAME_WIDTH))
+    altura = int(leitor.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    memoria = shared_memory.SharedMemory(create=True, size=max(1, n_slots * altura * largura * 3))
+    conexao.send((
+        memoria.name, float(leitor.get(cv2.CAP_PROP_FPS)) or 30.0, largura, altura,
+        int(leitor.get(cv2.CAP_PROP_FRAME_COUNT)) or 0,
+    ))
+    slots = np.ndarray((n_slots, altura, largura, 3), dtype=np.uint8, buffer=memoria.buf)
+
+    produzidos, erro = 0, None
+    try:
+        while not parar.is_set():
+            ok, frame = leitor.read()
+            if not ok:
+                break
+            while not livres.acquire(timeout=0.1):
+                if parar.is_set():
+                    break
+            else:
+                slots[produzidos % n_slots] = frame
+                prontos.release()
+                produzidos += 1
+    except Exception as e:
+        erro = f"{type(e).__name__}: {e}"
+
+    conexao.send((produzidos, erro))
+    leitor.release()
+    del slots
+    memoria.close()  # o unlink fica com o processo principal (release())
+
+class LeitorProcesso:
+    """
+    Mesma interface do FileVideoStream, mas a decodificação roda em outro processo
+    (sem disputar o GIL com detecção/emoção) e os frames chegam por um anel de
+    n_slots frames em memória compartilhada, sem pickle. Dois semáforos controlam
+    o anel (slots livres / slots prontos). read() copia o slot para um array próprio:
+    os frames seguem vivos nos estágios seguintes enquanto o slot já é reescrito.
+    """
+    def __init__(self, path: str, n_slots: int = 8, backend: str = "opencv", frame_step: int = 1,
+                 pular_keyframes: bool = False, largura_max: int = 0):
+        # "spawn": mesmo motivo do pool de detecção (processo pai com threads/TF)
+        ctx = multiprocessing.get_context("spawn")
+        self.n_slots = max(2, int(n_slots))
+        self.livres = ctx.Semaphore(self.n_slots)
+        self.prontos = ctx.Semaphore(0)
+        self.parar = ctx.Event()
+        self.conexao, conexao_filho = ctx.Pipe(duplex=False)
+        self.processo = ctx.Process(
+            target=_decodificar_em_processo,
+            args=(path, backend, frame_step, pular_keyframes, largura_max, self.n_slots,
+                  conexao_filho, self.livres, self.prontos, self.parar),
+            daemon=True,
+        )
+        self.processo.start()
+        conexao_filho.close()
+
+        try:
+            meta = self.conexao.recv()
+        except EOFError:
+            meta = (None, f"Não foi possível abrir o vídeo: {path} (processo de leitura encerrou)")
+        if meta[0] is None:
+            self.processo.join()
+            raise FileNotFoundError(meta[1])
+        nome, self.fps, self.width, self.height, self.total_frames = meta
+        self.memoria = shared_memory.SharedMemory(name=nome)
+        self.slots = np.ndarray((self.n_slots, self.height, self.width, 3), dtype=np.uint8, buffer=self.memoria.buf)
+
+        self.lidos = 0
+        self.produzidos = None  # total informado pelo processo ao terminar
+        self.erro = None
+        self.stopped = False
+
+    def start(self):
+        return self
+
+    def read(self):
+        while not self.stopped:
+            if self.prontos.acquire(timeout=0.1):
+                frame = self.slots[self.lidos % self.n_slots].copy()
+                self.livres.release()
+                self.lidos += 1
+                return True, frame
+            if self.produzidos is None and self.conexao.poll():
+                try:
+                    self.produzidos, erro = self.conexao.recv()
+                except EOFError:  # processo morreu sem mandar o total
+                    self.produzidos, erro = self.lidos, "terminou sem concluir"
+                if erro is not None:
+                    self.erro = RuntimeError(f"Erro no processo de leitura: {erro}")
+            if self.produzidos is not None:
+                # o total só é enviado depois do último release(): nada mais a chegar
+                self.stopped = self.lidos >= self.produzidos
+            elif not self.processo.is_alive() and not self.conexao.poll():
+                self.stopped = True
+                self.erro = RuntimeError("Erro no processo de leitura: terminou sem concluir")
+        if self.erro is not None:
+            raise self.erro
+        return False, None
+
+    def more(self):
+        return not self.stopped
+
+    def release(self):
+        self.stopped = True
+        if self.slots is None:
+            return
+        self.parar.set()
+        self.processo.join(timeout=5)
+        if self.processo.is_alive():
+            self.processo.terminate()
+        self.slots = None
+        self.memoria.close()
+        self.memoria.unlink()
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return self.total_frames
+        return 0
+
+
+# ============================================================
+# PIPELINE EM ESTÁGIOS (THREADS + FILAS LIMITADAS) — STEP A
+# ============================================================
+FIM_FILA = None  # sentinela que encerra um estágio
+
+
+class FalhaPipeline:
+    """
+    Primeira exceção de qualquer estágio do pipeline. Depois dela os estágios param de
+    processar (descartam itens), mas continuam consumindo as filas e repassando FIM_FILA,
+    para nenhum put()/get() ficar bloqueado; quem iniciou o pipeline relança o erro no fim.
+    """
+    def __init__(self):
+        self.erro = None
+        self.evento = Event()
+        self.lock = Lock()
+
+    @property
+    def ativa(self) -> bool:
+        return self.evento.is_set()
+
+    def registrar(self, erro: BaseException) -> None:
+        with self.lock:
+            if self.erro is None:
+                self.erro = erro
+        self.evento.set()
+
+    def relancar(self) -> None:
+        if self.erro is not None:
+            raise self.erro
+
+
+def drenar_fila(fila, fins: int, n_produtores: int) -> None:
+    """Descarta itens até chegarem as sentinelas que faltam (libera os produtores bloqueados)."""
+    while fins < n_produtores:
+        if fila.get() is FIM_FILA:
+            fins += 1
+
+
+def iniciar_thread(alvo, *args) -> Thread:
+    t = Thread(target=alvo, args=args)
+    t.daemon = True
+    t.start()
+    return t
+
+def executar_estagio(processar, fila_entrada, fila_saida, n_produtores: int = 1, falha: FalhaPipeline = None):
+    """
+    Loop genérico de um estágio do pipeline:
+    consome itens de fila_entrada, aplica processar(item) e repassa para fila_saida.
+    Encerra após receber uma sentinela de cada produtor e propaga uma única sentinela,
+    também quando processar() falha (o erro vai para `falha`; sem ela, é relançado).
+    """
+    propria = falha is None
+    falha = falha or FalhaPipeline()
+    fins = 0
+    try:
+        while fins < n_produtores:
+            item = fila_entrada.get()
+            if item is FIM_FILA:
+                fins += 1
+            elif not falha.ativa:
+                fila_saida.put(processar(item))
+    except Exception as e:
+        falha.registrar(e)
+        drenar_fila(fila_entrada, fins, n_produtores)
+    finally:
+        fila_saida.put(FIM_FILA)
+    if propria:
+        falha.relancar()
+
+def executar_estagio_em_lote(processar_lote, fila_entrada, fila_saida, max_itens: int,
+                             n_produtores: int = 1, espera: float = 0.0, falha: FalhaPipeline = None):
+    """
+    Variante em lote do executar_estagio: junta até max_itens da fila e processa todos
+    em uma única chamada de processar_lote(lista). Ex.: uma só inferência para as faces
+    de vários frames. Depois do primeiro item, espera até `espera` segundos por mais
+    itens (0 = leva só o que já está na fila) — lotes maiores enchem melhor a GPU.
+    Erros seguem a mesma regra do executar_estagio.
+    """
+    propria = falha is None
+    falha = falha or FalhaPipeline()
+    fins = 0
+    try:
+        while fins < n_produtores:
+            lote = []
+            item = fila_entrada.get()
+            limite = time.monotonic() + espera
+            while True:
+                if item is FIM_FILA:
+                    fins += 1
+                    if fins >= n_produtores:
+                        break
+                else:
+                    lote.append(item)
+                    if len(lote) >= max_itens:
+                        break
+                try:
+                    restante = limite - time.monotonic()
+                    item = fila_entrada.get(timeout=restante) if restante > 0 else fila_entrada.get_nowait()
+                except queue.Empty:
+                    break
+
+            if lote and not falha.ativa:
+                for resultado in processar_lote(lote):
+                    fila_saida.put(resultado)
+    except Exception as e:
+        falha.registrar(e)
+        drenar_fila(fila_entrada, fins, n_produtores)
+    finally:
+        fila_saida.put(FIM_FILA)
+    if propria:
+        falha.relancar()
+
+
 # ============================================================
 # UTILITÁRIOS DE ARQUIVO / VÍDEO
 # ============================================================
@@ -117,7 +869,31 @@ def ler_metadados_video(cap) -> dict:
         "area_frame": area_frame,
     }
 
-def criar_video_writer(caminho_saida: str, fps: float, largura: int, altura: int) -> cv2.VideoWriter:
+def criar_video_writer(
+    caminho_saida: str, fps: float, largura: int, altura: int, backend: str = "opencv", h264_hardware: bool = False
+):
+    if backend == "pyav":
+        return EscritorPyAV(caminho_saida, fps, largura, altura)
+    if backend == "cudacodec":
+        return EscritorCudaCodec(caminho_saida, fps, largura, altura)
+    if backend == "ffmpeg":
+        return EscritorFFmpeg(caminho_saida, fps, largura, altura)
+    return abrir_escritor_opencv(caminho_saida, fps, largura, altura, h264_hardware)
+
+def abrir_escritor_opencv(
+    caminho_saida: str, fps: float, largura: int, altura: int, h264_hardware: bool = False
+) -> cv2.VideoWriter:
+    """
+    mp4v de software; com h264_hardware, tenta antes o H.264 por hardware (NVENC/VAAPI/QSV/
+    MediaFoundation, o mesmo pedido de aceleração da leitura) quando o build do OpenCV consegue.
+    O H.264 só é mantido se o encoder aberto for mesmo de hardware: o x264 de software,
+    com os padrões do OpenCV, codifica mais devagar que o mp4v.
+    """
+    if h264_hardware:
+        escritor = _abrir_h264_hardware(caminho_saida, fps, largura, altura)
+        if escritor is not None:
+            return escritor
+
     return cv2.VideoWriter(
         caminho_saida,
         cv2.VideoWriter_fourcc(*"mp4v"),
@@ -125,19 +901,248 @@ def criar_video_writer(caminho_saida: str, fps: float, largura: int, altura: int
         (largura, altura),
     )
 
+def _abrir_h264_hardware(caminho_saida: str, fps: float, largura: int, altura: int):
+    """cv2.VideoWriter H.264 com encoder de hardware, ou None se o build não tiver."""
+    nivel_log = None
+    try:
+        # sem encoder de hardware a tentativa só loga erro do OpenCV/libav: silenciado durante ela
+        nivel_log = cv2.utils.logging.getLogLevel()
+        cv2.utils.logging.setLogLevel(cv2.utils.logging.LOG_LEVEL_SILENT)
+        escritor = cv2.VideoWriter(
+            caminho_saida, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*"avc1"), fps, (largura, altura),
+            [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY],
+        )
+        if escritor.isOpened():
+            if escritor.get(cv2.VIDEOWRITER_PROP_HW_ACCELERATION) > cv2.VIDEO_ACCELERATION_NONE:
+                return escritor
+            escritor.release()
+    except (cv2.error, AttributeError):
+        pass  # OpenCV sem cv2.utils.logging ou sem as propriedades de aceleração (< 4.5.2)
+    finally:
+        if nivel_log is not None:
+            cv2.utils.logging.setLogLevel(nivel_log)
+    return None
+
+class EscritorVideoAssincrono:
+    """
+    Envolve um VideoWriter e faz a codificação em thread separada, alimentada por fila limitada.
+    Mesma interface (write/release), então pode substituir o escritor direto.
+    Os frames vindos de cap.read()/FileVideoStream já são arrays próprios (não reaproveitados
+    pelo decoder), por isso não é preciso copiá-los antes de enfileirar.
+    """
+    def __init__(self, escritor, queue_size: int = 32):
+        self.escritor = escritor
+        self.Q = FilaSPSC(queue_size)
+        self.erro = None  # exceção do encoder, relançada em write()/release()
+        self.thread = Thread(target=self._loop, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _loop(self):
+        while True:
+            frame = self.Q.get()
+            if frame is None:
+                return
+            if self.erro is not None:
+                continue  # encoder já falhou: só esvazia a fila até o release()
+            try:
+                self.escritor.write(frame)
+            except Exception as e:
+                self.erro = e
+
+    def write(self, frame):
+        if self.erro is not None:
+            raise self.erro
+        self.Q.put(frame)
+
+    def release(self):
+        self.Q.put(None)
+        self.thread.join()
+        self.escritor.release()
+        if self.erro is not None:
+            raise self.erro
+
 
 # ============================================================
-# DETECÇÃO DE FACES (DeepFace)
+# MODELOS (construídos uma única vez e reaproveitados)
 # ============================================================
-def detectar_faces(frame_bgr, detector_backend: str, enforce_detection: bool):
-    return DeepFace.extract_faces(
-        img_path=frame_bgr,
-        detector_backend=detector_backend,
-        enforce_detection=enforce_detection,
-        align=False,  # mais rápido
+_MODELOS = {}
+_lock_modelos = RLock()  # reentrante: construir um modelo pode pedir outro (ex.: o módulo DeepFace)
+
+def obter_modelo(chave: str, construir):
+    """
+    Singleton por chave: o hot loop só chama o forward do modelo,
+    sem passar pelo despacho/validação do DeepFace a cada frame.
+    """
+    modelo = _MODELOS.get(chave)
+    if modelo is None:
+        with _lock_modelos:
+            modelo = _MODELOS.get(chave)
+            if modelo is None:
+                modelo = construir()
+                _MODELOS[chave] = modelo
+    return modelo
+
+def _deepface():
+    """
+    DeepFace (e com ele o TensorFlow) importado só no primeiro uso, não no import deste módulo:
+    o Step B e os caminhos YuNet/ONNX não pagam os segundos do import do TF, e no Step A ele
+    acontece no aquecimento, em paralelo com a abertura do vídeo.
+    """
+    return obter_modelo("modulo_deepface", lambda: importlib.import_module("deepface").DeepFace)
+
+def _face_recognition():
+    """face_recognition (dlib + modelos) importado só quando há identidade para calcular."""
+    return obter_modelo("modulo_face_recognition", lambda: importlib.import_module("face_recognition"))
+
+class ModeloEmocaoONNX:
+    """
+    Modelo de emoção exportado para ONNX (FP16/INT8, ver exportar_modelo_emocao.py)
+    rodando no ONNX Runtime, com a mesma interface predict/predict_on_batch do modelo Keras.
+    Com onnxruntime-gpu, o provider TensorRT compila uma engine FP16 na primeira execução.
+    """
+    def __init__(self, caminho: str):
+        import onnxruntime as ort  # opcional: só necessário quando há modelo ONNX
+
+        # TensorRT (engine FP16 compilada uma vez e cacheada ao lado do .onnx) > CUDA > CPU
+        opcoes_trt = {
+            "trt_fp16_enable": True,
+            "trt_engine_cache_enable": True,
+            "trt_engine_cache_path": os.path.dirname(os.path.abspath(caminho)),
+        }
+        disponiveis = ort.get_available_providers()
+        providers = [
+            (p, opcoes_trt) if p == "TensorrtExecutionProvider" else p
+            for p in ("TensorrtExecutionProvider", "CUDAExecutionProvider", "CPUExecutionProvider")
+            if p in disponiveis
+        ]
+        self.sessao = ort.InferenceSession(caminho, providers=providers)
+
+        entrada = self.sessao.get_inputs()[0]
+        self.nome_entrada = entrada.name
+        self.tipo_entrada = np.float16 if entrada.type == "tensor(float16)" else np.float32
+
+    def predict_on_batch(self, x):
+        saida = self.sessao.run(None, {self.nome_entrada: x.astype(self.tipo_entrada, copy=False)})[0]
+        return saida.astype(np.float32, copy=False)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        return self.predict_on_batch(x)
+
+def _construir_modelo_emocao(caminho_onnx=None):
+    if caminho_onnx and os.path.exists(caminho_onnx):
+        return ModeloEmocaoONNX(caminho_onnx)
+    # cliente "Emotion" do DeepFace; guardamos só o modelo Keras interno
+    return _deepface().build_model(model_name="Emotion", task="facial_attribute").model
+
+
+# ============================================================
+# DETECÇÃO DE FACES (YuNet / DeepFace)
+# ============================================================
+YUNET_ARQUIVO = "face_detection_yunet_2023mar.onnx"
+YUNET_URL = f"https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/{YUNET_ARQUIVO}"
+YUNET_LIMIAR_SCORE = 0.6
+
+def _backend_dnn() -> tuple:
+    """(backend_id, target_id) do cv2.dnn: CUDA quando o OpenCV foi compilado com ela e há GPU."""
+    try:
+        if cv2.cuda.getCudaEnabledDeviceCount() > 0:
+            return cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA
+    except Exception:
+        pass
+    return cv2.dnn.DNN_BACKEND_DEFAULT, cv2.dnn.DNN_TARGET_CPU
+
+def _construir_yunet():
+    # pesos baixados (e cacheados) pelo próprio DeepFace; o tamanho de entrada é ajustado por frame
+    weight_utils = importlib.import_module("deepface.commons.weight_utils")
+    caminho = weight_utils.download_weights_if_necessary(file_name=YUNET_ARQUIVO, source_url=YUNET_URL)
+    backend_id, target_id = _backend_dnn()
+    return cv2.FaceDetectorYN.create(
+        caminho, "", (320, 320),
+        score_threshold=YUNET_LIMIAR_SCORE, backend_id=backend_id, target_id=target_id,
+    )
+
+def _detectar_faces_yunet(frame_bgr):
+    altura, largura = frame_bgr.shape[:2]
+    detector = obter_modelo("yunet", _construir_yunet)
+    if tuple(detector.getInputSize()) != (largura, altura):
+        detector.setInputSize((largura, altura))
+
+    _, faces = detector.detect(frame_bgr)
+    if faces is None:
+        return []
+
+    # cada linha: x, y, w, h, 5 landmarks (x, y), score — no mesmo formato do DeepFace
+    return [
+        {
+            "facial_area": {"x": int(f[0]), "y": int(f[1]), "w": int(f[2]), "h": int(f[3])},
+            "confidence": float(f[14]),
+        }
+        for f in faces
+    ]
+
+def _detectar_faces_deepface(frame_bgr, detector_backend: str, enforce_detection: bool):
+    """
+    Chama o detector do DeepFace diretamente (sem extract_faces): sem alinhamento,
+    normalização e recorte das faces, que aqui não são usados — só as bboxes.
+    """
+    detector = obter_modelo(
+        f"detector_{detector_backend}",
+        lambda: _deepface().build_model(model_name=detector_backend, task="face_detector"),
     )
+    regioes = detector.detect_faces(frame_bgr)
+
+    if not regioes and enforce_detection:
+        raise ValueError("Face could not be detected.")
+
+    return [
+        {
+            "facial_area": {"x": r.x, "y": r.y, "w": r.w, "h": r.h},
+            "confidence": r.confidence,
+        }
+        for r in regioes
+    ]
+
+def _construir_haar():
+    """Cascade Haar frontal que vem com o OpenCV; False se o build não trouxer objdetect ou o XML."""
+    pasta = getattr(getattr(cv2, "data", None), "haarcascades", "")
+    try:
+        cascade = cv2.CascadeClassifier(os.path.join(pasta, "haarcascade_frontalface_default.xml"))
+    except (AttributeError, cv2.error):
+        return False
+    return False if cascade.empty() else cascade
+
+def pode_ter_face(frame_bgr, escala: float = 0.25, min_lado: int = 12) -> bool:
+    """
+    Pré-filtro barato (Haar em cinza, a 1/4 da resolução, ~1 ms): False só quando a
+    cascade não acha nenhuma face, e aí o detector pesado pode ser pulado. Faces com
+    lado < min_lado / escala px no frame original (ou de perfil) escapam do Haar.
+    Sem a cascade no build do OpenCV, nunca bloqueia.
+    """
+    cascade = obter_modelo("haar_frontal", _construir_haar)
+    if cascade is False:
+        return True
+    pequeno = cv2.resize(frame_bgr, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+    cinza = cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY)
+    return len(cascade.detectMultiScale(cinza, 1.3, 5, minSize=(min_lado, min_lado))) > 0
+
+def detectar_faces(frame_bgr, detector_backend: str, enforce_detection: bool):
+    if detector_backend == "yunet":
+        return _detectar_faces_yunet(frame_bgr)
+    return _detectar_faces_deepface(frame_bgr, detector_backend, enforce_detection)
 
 def extrair_bbox_e_confianca(face_dict: dict) -> dict:
+    # caminho comum: dict completo vindo de detectar_faces, acesso direto sem .get
+    try:
+        area, confianca = face_dict["facial_area"], face_dict["confidence"]
+        return {
+            "x": int(area["x"]), "y": int(area["y"]), "w": int(area["w"]), "h": int(area["h"]),
+            "tem_confianca": confianca is not None,
+            "confianca": float(confianca) if confianca is not None else None,
+        }
+    except (KeyError, TypeError):
+        pass
+
     confianca = face_dict.get("confidence", None)
     facial_area = face_dict.get("facial_area", {}) or {}
     return {
@@ -149,57 +1154,256 @@ def extrair_bbox_e_confianca(face_dict: dict) -> dict:
         "confianca": float(confianca) if confianca is not None else None,
     }
 
-def calcular_area_e_ar(w: int, h: int) -> tuple:
-    if w <= 0 or h <= 0:
-        return 0, 0.0
-    return w * h, (w / float(h))
+
+# ============================================================
+# FACES DE UM FRAME (ESTRUTURA DE ARRAYS)
+# ============================================================
+class FacesFrame:
+    """
+    Faces de um frame em estrutura de arrays (SoA): bboxes (x, y, w, h) e caixas de
+    recorte (x1, y1, x2, y2) em matrizes int32 (K, 4) contíguas, com crops/emoções/nomes
+    em listas alinhadas — no lugar de uma lista com um dict por face.
+    """
+    def __init__(self, xywh=None, caixas=None, crops=None):
+        self.xywh = np.zeros((0, 4), dtype=np.int32) if xywh is None else np.ascontiguousarray(xywh, dtype=np.int32)
+        self.caixas = np.zeros((0, 4), dtype=np.int32) if caixas is None else np.ascontiguousarray(caixas, dtype=np.int32)
+        self.crops = crops if crops is not None else []  # views do frame, consumidas pelo estágio de emoção
+        self.emocoes = [None] * len(self.xywh)
+        self.nomes = ["Desconhecido"] * len(self.xywh)
+
+    def __len__(self) -> int:
+        return len(self.xywh)
+
+    def selecionar(self, indices) -> "FacesFrame":
+        """Subconjunto das faces (na ordem de indices)."""
+        indices = list(indices)
+        novo = FacesFrame(self.xywh[indices], self.caixas[indices], [self.crops[i] for i in indices] if self.crops else [])
+        novo.emocoes = [self.emocoes[i] for i in indices]
+        novo.nomes = [self.nomes[i] for i in indices]
+        return novo
+
+    def com_xywh(self, xywh) -> "FacesFrame":
+        """Mesmas faces/rótulos com bboxes novas (ex.: movidas pelo rastreador)."""
+        novo = FacesFrame(xywh, self.caixas)
+        novo.emocoes, novo.nomes = self.emocoes, self.nomes
+        return novo
+
+
+# ============================================================
+# RASTREAMENTO ENTRE FRAMES ANALISADOS (MOSSE)
+# ============================================================
+def _criar_rastreador():
+    # MOSSE (opencv-contrib): filtro de correlação, < 1 ms por face
+    if hasattr(cv2, "legacy") and hasattr(cv2.legacy, "TrackerMOSSE_create"):
+        return cv2.legacy.TrackerMOSSE_create()
+    if hasattr(cv2, "TrackerKCF_create"):
+        return cv2.TrackerKCF_create()
+    return None
+
+def iniciar_rastreadores(frame, faces) -> list:
+    """Um rastreador por face, inicializado na bbox detectada (lista vazia se não houver tracker no OpenCV)."""
+    rastreadores = []
+    for x, y, w, h in faces.xywh.tolist():
+        rastreador = _criar_rastreador()
+        if rastreador is None:
+            return []
+        rastreador.init(frame, (x, y, w, h))
+        rastreadores.append(rastreador)
+    return rastreadores
+
+def atualizar_rastreadores(rastreadores, frame, faces):
+    """
+    Move as bboxes das faces do último frame analisado para o frame atual.
+    Devolve (novo FacesFrame, nº de rastreadores perdidos) — o original já foi
+    contabilizado; se o rastreador se perder, a face mantém a última posição conhecida.
+    """
+    H, W = frame.shape[:2]
+    xywh = faces.xywh.copy()
+    perdidos = 0
+    for i, rastreador in enumerate(rastreadores):
+        ok, bbox = rastreador.update(frame)
+        if ok:
+            xywh[i] = [int(v) for v in bbox]
+        else:
+            perdidos += 1
+
+    np.clip(xywh[:, 0], 0, W - 1, out=xywh[:, 0])
+    np.clip(xywh[:, 1], 0, H - 1, out=xywh[:, 1])
+    xywh[:, 2] = np.clip(xywh[:, 2], 1, W - xywh[:, 0])
+    xywh[:, 3] = np.clip(xywh[:, 3], 1, H - xywh[:, 1])
+    return faces.com_xywh(xywh), perdidos
 
 
 # ============================================================
 # AUTOAJUSTE / FILTROS (STEP A)
 # ============================================================
+@njit(cache=True)
+def _p2_atualizar(q, n, n_desejado, dn, contagem, valores):
+    """Passo do algoritmo P² (Jain & Chlamtac) para cada valor; devolve a nova contagem."""
+    for x in valores:
+        if contagem < 5:
+            # fase inicial: os 5 primeiros valores ficam ordenados nos marcadores
+            i = contagem
+            while i > 0 and q[i - 1] > x:
+                q[i] = q[i - 1]
+                i -= 1
+            q[i] = x
+            contagem += 1
+            continue
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            n_desejado[i] += dn[i]
+
+        # ajusta os 3 marcadores internos (parabólico, ou linear se sair da ordem)
+        for i in range(1, 4):
+            d = n_desejado[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                s = 1.0 if d > 0 else -1.0
+                qp = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not (q[i - 1] < qp < q[i + 1]):
+                    j = i + int(s)
+                    qp = q[i] + s * (q[j] - q[i]) / (n[j] - n[i])
+                q[i] = qp
+                n[i] += s
+    return contagem
+
+class P2Quantil:
+    """
+    Quantil p (0-1) estimado em streaming pelo algoritmo P²: 5 marcadores, O(1) de
+    memória e de tempo por amostra, sem guardar as amostras. Com menos de 5 amostras
+    devolve o percentil exato delas.
+    """
+    def __init__(self, p: float):
+        self.p = p
+        self.q = np.zeros(5, dtype=np.float64)
+        self.n = np.arange(5, dtype=np.float64)
+        self.n_desejado = np.array([0, 2 * p, 4 * p, 2 + 2 * p, 4], dtype=np.float64)
+        self.dn = np.array([0, p / 2, p, (1 + p) / 2, 1], dtype=np.float64)
+        self.contagem = 0
+
+    def atualizar(self, valores) -> None:
+        valores = np.asarray(valores, dtype=np.float64)
+        if len(valores):
+            self.contagem = _p2_atualizar(self.q, self.n, self.n_desejado, self.dn, self.contagem, valores)
+
+    def valor(self) -> float:
+        if self.contagem < 5:
+            return float(np.percentile(self.q[:self.contagem], 100 * self.p)) if self.contagem else 0.0
+        return float(self.q[2])
+
 class AutoajusteLimiar:
-    def __init__(self, frames_warmup_analisados: int, area_frame: int, debug: bool = False):
+    """
+    Limiares por percentis das faces vistas no warm-up. estimador="exato" guarda as
+    amostras e chama np.percentile uma vez no fim; "p2" atualiza um P2Quantil por
+    limiar a cada frame (memória constante, sem o pico do percentil no fim do warm-up).
+    """
+    def __init__(self, frames_warmup_analisados: int, area_frame: int, debug: bool = False, estimador: str = "exato"):
         self.frames_warmup_analisados = frames_warmup_analisados
         self.area_frame = area_frame
         self.debug = debug
 
-        self.amostras_area = []
-        self.amostras_ar = []
-        self.amostras_confianca = []
+        # amostras em arrays pré-alocados (crescem só se um frame passar da capacidade)
+        capacidade = max(16, 2 * frames_warmup_analisados) if estimador != "p2" else 0
+        self.amostras_area = np.empty(capacidade, dtype=np.float64)
+        self.amostras_ar = np.empty(capacidade, dtype=np.float64)
+        self.amostras_confianca = np.empty(capacidade, dtype=np.float64)
+        self.n_amostras = 0
+        self.n_confianca = 0
         self.limiares_definidos = False
 
-    def adicionar_amostra(self, area, ar, tem_confianca, confianca):
+        self.quantis = None
+        if estimador == "p2":
+            self.quantis = {
+                "area": (P2Quantil(0.10), P2Quantil(0.95)),
+                "ar": (P2Quantil(0.05), P2Quantil(0.95)),
+                "confianca": (P2Quantil(0.20),),
+            }
+
+    def _garantir_capacidade(self, extra: int) -> None:
+        necessario = self.n_amostras + extra
+        if necessario > len(self.amostras_area):
+            novo = max(necessario, 2 * len(self.amostras_area))
+            self.amostras_area = np.resize(self.amostras_area, novo)
+            self.amostras_ar = np.resize(self.amostras_ar, novo)
+            self.amostras_confianca = np.resize(self.amostras_confianca, novo)
+
+    def adicionar_amostras(self, area, ar, confianca):
+        """
+        Amostras de todas as faces de um frame de uma vez (vetores alinhados;
+        confiança NaN = detector sem score). Depois do warm-up não faz nada.
+        """
+        if self.limiares_definidos:
+            return
+
         # evita pegar outliers muito grandes no warm-up
-        if area > 0 and area < 0.6 * self.area_frame:
-            self.amostras_area.append(area)
-            self.amostras_ar.append(ar)
-            if tem_confianca and confianca is not None:
-                self.amostras_confianca.append(float(confianca))
+        validas = (area > 0) & (area < 0.6 * self.area_frame)
+        area, ar, confianca = area[validas], ar[validas], confianca[validas]
+        confianca = confianca[~np.isnan(confianca)]
+
+        if self.quantis is not None:
+            for grandeza, valores in (("area", area), ("ar", ar), ("confianca", confianca)):
+                for quantil in self.quantis[grandeza]:
+                    quantil.atualizar(valores)
+            self.n_amostras += len(area)
+            self.n_confianca += len(confianca)
+            return
+
+        self._garantir_capacidade(len(area))
+        self.amostras_area[self.n_amostras:self.n_amostras + len(area)] = area
+        self.amostras_ar[self.n_amostras:self.n_amostras + len(ar)] = ar
+        self.amostras_confianca[self.n_confianca:self.n_confianca + len(confianca)] = confianca
+        self.n_amostras += len(area)
+        self.n_confianca += len(confianca)
 
     def pronto_para_definir(self) -> bool:
-        return (not self.limiares_definidos) and (len(self.amostras_area) >= self.frames_warmup_analisados)
+        return (not self.limiares_definidos) and (self.n_amostras >= self.frames_warmup_analisados)
 
     def definir_limiares(self, limiares: dict) -> dict:
-        if not self.amostras_area:
+        if self.n_amostras == 0:
             return limiares
 
-        limiares["MIN_AREA_FACE"] = int(np.percentile(self.amostras_area, 10))
-        limiares["MAX_AREA_FACE"] = int(np.percentile(self.amostras_area, 95))
-        limiares["MIN_AR"] = float(np.percentile(self.amostras_ar, 5))
-        limiares["MAX_AR"] = float(np.percentile(self.amostras_ar, 95))
+        if self.quantis is not None:
+            p_area = [q.valor() for q in self.quantis["area"]]
+            p_ar = [q.valor() for q in self.quantis["ar"]]
+        else:
+            # um np.percentile por grandeza, com todos os percentis de uma vez
+            p_area = np.percentile(self.amostras_area[:self.n_amostras], [10, 95])
+            p_ar = np.percentile(self.amostras_ar[:self.n_amostras], [5, 95])
+        limiares["MIN_AREA_FACE"] = int(p_area[0])
+        limiares["MAX_AREA_FACE"] = int(p_area[1])
+        limiares["MIN_AR"] = float(p_ar[0])
+        limiares["MAX_AR"] = float(p_ar[1])
 
         # fallback se o vídeo tiver AR "apertado demais" e percentis colarem
         if (limiares["MAX_AR"] - limiares["MIN_AR"]) < 0.15:
             limiares["MIN_AR"] = 0.6
             limiares["MAX_AR"] = 1.6
 
-        if len(self.amostras_confianca) > 0:
-            limiares["MIN_CONFIANCA"] = float(np.percentile(self.amostras_confianca, 20))
+        if self.n_confianca > 0 and self.quantis is not None:
+            limiares["MIN_CONFIANCA"] = self.quantis["confianca"][0].valor()
+        elif self.n_confianca > 0:
+            limiares["MIN_CONFIANCA"] = float(np.percentile(self.amostras_confianca[:self.n_confianca], 20))
         else:
             limiares["MIN_CONFIANCA"] = 0.0
 
         self.limiares_definidos = True
+        # as amostras não são mais lidas: libera os buffers do warm-up
+        self.amostras_area = self.amostras_ar = self.amostras_confianca = None
         if self.debug:
             print(
                 f"[DEBUG] Autoajuste definido! "
@@ -210,173 +1414,717 @@ class AutoajusteLimiar:
         return limiares
 
 
-def passa_filtros_geometricos(area, ar, limiares):
-    if area < limiares["MIN_AREA_FACE"] or area > limiares["MAX_AREA_FACE"]:
-        return False
-    if not (limiares["MIN_AR"] <= ar <= limiares["MAX_AR"]):
-        return False
-    return True
+def mascara_filtros(area, ar, confianca, limiares):
+    """
+    Filtros geométricos (área, AR) + confiança para todas as faces do frame de uma vez.
+    area/ar/confianca são vetores alinhados; confiança NaN = detector sem score (passa).
+    """
+    mascara = (area >= limiares["MIN_AREA_FACE"]) & (area <= limiares["MAX_AREA_FACE"])
+    mascara &= (ar >= limiares["MIN_AR"]) & (ar <= limiares["MAX_AR"])
+    mascara &= np.isnan(confianca) | (confianca >= limiares["MIN_CONFIANCA"])
+    return mascara
 
-def passa_filtro_confianca(tem_confianca, confianca, limiares):
-    if not tem_confianca or confianca is None:
-        return True
-    return confianca >= limiares["MIN_CONFIANCA"]
+class HistoricoIds:
+    """
+    Histórico recente de ids de face (células do grid).
+    Com numba, o anel fixo np.int32 (maxlen, 2) é lido e escrito pelo kernel de
+    filtrar_e_persistir; sem numba, uma janela deslizante (deque + Counter) mantém a
+    contagem por célula em O(1) por face.
+    """
+    def __init__(self, maxlen: int = 10):
+        self.buf = np.full((maxlen, 2), -1, dtype=np.int32)  # -1 = posição vazia
+        self.pos = 0
+        self.janela = None if NUMBA_DISPONIVEL else deque(maxlen=maxlen)
+        self.contagem = Counter()
+
+    def registrar_e_contar(self, cx: int, cy: int) -> int:
+        """Caminho sem numba: registra a célula na janela e devolve quantas vezes ela aparece."""
+        chave = (cx << 32) | (cy & 0xFFFFFFFF)  # célula empacotada em um int (sem tupla por face)
+        if len(self.janela) == self.janela.maxlen:
+            antiga = self.janela[0]
+            self.contagem[antiga] -= 1
+            if not self.contagem[antiga]:
+                del self.contagem[antiga]
+        self.janela.append(chave)
+        self.contagem[chave] += 1
+        return self.contagem[chave]
+
+def celulas_grid(x, y, grid: int):
+    """
+    Id de grid de todas as faces do frame: round(x / grid), round(y / grid) em aritmética
+    inteira (divmod + arredondamento para o par, como o round() do Python), sem floats.
+    """
+    def arredondar(v):
+        q, r = np.divmod(np.asarray(v, dtype=np.int64), grid)
+        return q + ((2 * r > grid) | ((2 * r == grid) & (q % 2 == 1)))
+    return arredondar(x), arredondar(y)
 
-def passa_persistencia(historico_ids, x, y, grid, k):
+def passa_persistencia(historico_ids, cx, cy, k):
     """
-    Persistência temporal simplificada: bbox próxima deve aparecer >=k vezes no histórico.
+    Persistência temporal simplificada: a célula (cx, cy) da bbox deve aparecer >=k vezes no histórico.
     """
-    id_face = (round(x / grid), round(y / grid))
-    historico_ids.append(id_face)
+    count = historico_ids.registrar_e_contar(cx, cy)
     if k <= 1:
         return True
-    return historico_ids.count(id_face) >= k
+    return count >= k
+
+@njit(cache=True)
+def _filtrar_e_persistir(area, ar, confianca, cx, cy, limites, k, buf, pos):
+    """
+    Kernel único por frame: filtros (área, AR, confiança) + persistência das células
+    (cx, cy) no anel, face a face na mesma ordem do caminho em Python.
+    limites = [MIN_AREA, MAX_AREA, MIN_AR, MAX_AR, MIN_CONFIANCA].
+    Devolve (máscara de aceitas, nova posição do anel).
+    """
+    n = area.shape[0]
+    aceitas = np.zeros(n, dtype=np.bool_)
+    for i in range(n):
+        if area[i] < limites[0] or area[i] > limites[1]:
+            continue
+        if ar[i] < limites[2] or ar[i] > limites[3]:
+            continue
+        if not np.isnan(confianca[i]) and confianca[i] < limites[4]:
+            continue
+
+        buf[pos, 0] = cx[i]
+        buf[pos, 1] = cy[i]
+        pos = (pos + 1) % buf.shape[0]
+        count = 0
+        for j in range(buf.shape[0]):
+            if buf[j, 0] == cx[i] and buf[j, 1] == cy[i]:
+                count += 1
+        aceitas[i] = k <= 1 or count >= k
+    return aceitas, pos
+
+def filtrar_e_persistir(area, ar, confianca, x, y, limiares, historico_ids, grid, k):
+    """
+    Índices das faces do frame que passam nos filtros e na persistência.
+    Com numba tudo roda em um kernel compilado; sem numba, máscara vetorizada
+    + persistência face a face na janela deslizante do HistoricoIds.
+    """
+    cx, cy = celulas_grid(x, y, grid)
+    if historico_ids.janela is None:
+        limites = np.array([
+            limiares["MIN_AREA_FACE"], limiares["MAX_AREA_FACE"],
+            limiares["MIN_AR"], limiares["MAX_AR"], limiares["MIN_CONFIANCA"],
+        ], dtype=np.float64)
+        aceitas, historico_ids.pos = _filtrar_e_persistir(
+            area.astype(np.float64), ar.astype(np.float64), confianca,
+            cx, cy, limites, k, historico_ids.buf, historico_ids.pos,
+        )
+        return np.flatnonzero(aceitas)
+
+    indices = np.flatnonzero(mascara_filtros(area, ar, confianca, limiares))
+    return [
+        i for i, cx_i, cy_i in zip(indices.tolist(), cx[indices].tolist(), cy[indices].tolist())
+        if passa_persistencia(historico_ids, cx_i, cy_i, k)
+    ]
 
 
 # ============================================================
 # EMOÇÃO / IDENTIDADE
 # ============================================================
-def recortar_rosto(frame_bgr, x, y, w, h, largura, altura, pad_ratio=0.15):
-    pad = int(pad_ratio * max(w, h))
-    x1, y1 = max(0, x - pad), max(0, y - pad)
-    x2, y2 = min(largura, x + w + pad), min(altura, y + h + pad)
-    return frame_bgr[y1:y2, x1:x2]
+# rótulos internados: Counter/dicts de emoção comparam por identidade antes do hash
+EMOCOES = tuple(sys.intern(e) for e in ("angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"))
+EMOCAO_DESCONHECIDA = sys.intern("unknown")
+ID_EMOCAO = {emo: i for i, emo in enumerate(EMOCOES)}
+ID_EMOCAO_DESCONHECIDA = len(EMOCOES)  # "unknown" e rótulos fora do modelo
+
+class RegistroFaces:
+    """
+    Registro das faces contabilizadas: contagem de emoções em um vetor np.int64
+    indexado pelo id da emoção e um log em array estruturado (uma linha por face),
+    crescendo em blocos geométricos. O Counter do resumo só é montado no final.
+    """
+    DTYPE = [("frame", "i4"), ("x", "i2"), ("y", "i2"), ("w", "i2"), ("h", "i2"), ("emo", "u1"), ("nome", "i2")]
+
+    def __init__(self, known_names, capacidade: int = 1024):
+        self.contagem = np.zeros(len(EMOCOES) + 1, dtype=np.int64)
+        self.log = np.empty(capacidade, dtype=self.DTYPE)
+        self.n = 0
+        # -1 = "Desconhecido"
+        self.nomes = list(dict.fromkeys(known_names))
+        self.id_nome = {nome: i for i, nome in enumerate(self.nomes)}
+
+    def adicionar(self, indice_frame: int, faces) -> None:
+        fim = self.n + len(faces)
+        if fim > len(self.log):
+            self.log = np.resize(self.log, max(fim, 2 * len(self.log)))
+
+        n = len(faces)
+        emo = np.fromiter((ID_EMOCAO.get(e, ID_EMOCAO_DESCONHECIDA) for e in faces.emocoes), dtype=np.uint8, count=n)
+        self.contagem += np.bincount(emo, minlength=len(self.contagem))
+
+        bloco = self.log[self.n:fim]
+        bloco["frame"] = indice_frame
+        bloco["x"], bloco["y"], bloco["w"], bloco["h"] = faces.xywh.T
+        bloco["emo"] = emo
+        bloco["nome"] = np.fromiter((self.id_nome.get(nome, -1) for nome in faces.nomes), dtype=np.int16, count=n)
+        self.n = fim
+
+    def contador_emocoes(self) -> Counter:
+        rotulos = EMOCOES + (EMOCAO_DESCONHECIDA,)
+        return Counter({rotulos[i]: int(v) for i, v in enumerate(self.contagem) if v})
+
+    def salvar(self, caminho: str) -> None:
+        np.save(caminho, self.log[:self.n])
+
+def calcular_caixas_recorte(xywh, largura, altura, pad_ratio=0.15):
+    """
+    Caixas de recorte de todas as faces do frame de uma vez: margem de pad_ratio·max(w, h)
+    em volta de cada bbox, limitada ao frame. (K, 4) bboxes → (K, 4) caixas (x1, y1, x2, y2).
+    """
+    xywh = np.asarray(xywh, dtype=np.int64)
+    x, y, w, h = xywh[:, 0], xywh[:, 1], xywh[:, 2], xywh[:, 3]
+    pad = (pad_ratio * np.maximum(w, h)).astype(np.int64)
+    return np.stack([
+        np.maximum(0, x - pad), np.maximum(0, y - pad),
+        np.minimum(largura, x + w + pad), np.minimum(altura, y + h + pad),
+    ], axis=1)
 
 def _normalizar_resultado_analise(resultado):
     if isinstance(resultado, list):
         return resultado[0] if len(resultado) > 0 else None
     return resultado if isinstance(resultado, dict) else None
 
-def analisar_emocao(face_crop_bgr):
+def _suporta_detector_skip() -> bool:
+    """Sonda única: o DeepFace instalado aceita detector_backend="skip"? (versões antigas não)"""
+    try:
+        _deepface().analyze(
+            img_path=np.zeros((96, 96, 3), dtype=np.uint8),
+            actions=["emotion"],
+            enforce_detection=False,
+            detector_backend="skip",
+        )
+        return True
+    except Exception:
+        return False
+
+def _analisar_emocao_individual(face_crop_bgr):
     """
-    Emoção robusta:
-    1) tenta detector_backend="skip" (sem redetecção)
-    2) fallback para analyze padrão
+    Emoção robusta (uma face por chamada): detector_backend="skip" (sem redetecção)
+    quando o DeepFace instalado suporta — decidido uma vez por processo, não com
+    uma exceção por face —, senão o analyze padrão.
     """
-    if face_crop_bgr is None or face_crop_bgr.size == 0:
-        return None
-
     # crops muito pequenos quebram/ficam instáveis em alguns modelos
     if face_crop_bgr.shape[0] < 48 or face_crop_bgr.shape[1] < 48:
         face_crop_bgr = cv2.resize(face_crop_bgr, (96, 96), interpolation=cv2.INTER_LINEAR)
 
+    opcoes = {"detector_backend": "skip"} if obter_modelo("deepface_skip", _suporta_detector_skip) else {}
     try:
-        res = DeepFace.analyze(
+        res = _deepface().analyze(
             img_path=face_crop_bgr,
             actions=["emotion"],
             enforce_detection=False,
-            detector_backend="skip",
+            **opcoes,
         )
     except Exception:
-        try:
-            res = DeepFace.analyze(
-                img_path=face_crop_bgr,
-                actions=["emotion"],
-                enforce_detection=False,
-            )
-        except Exception:
-            return None
+        return None
 
     return _normalizar_resultado_analise(res)
 
-def carregar_banco_faces(pasta_imagens):
+_buffers_emocao = local()  # um buffer de lote por thread (workers de emoção)
+
+def _obter_buffer_emocao(n: int):
+    """Buffer float32 (n, 48, 48) reaproveitado entre lotes da mesma thread; cresce só quando precisa."""
+    buf = getattr(_buffers_emocao, "lote", None)
+    if buf is None or buf.shape[0] < n:
+        buf = np.empty((max(n, 16), 48, 48), dtype=np.float32)
+        _buffers_emocao.lote = buf
+    return buf[:n]
+
+def _preprocessar_emocao(face_crop_bgr, destino):
+    """
+    Mesmo pré-processamento do DeepFace.analyze (0.0.96, detector "skip") para o modelo
+    "Emotion": crop em [0, 1], encaixado em 224x224 mantendo a proporção (centralizado,
+    resto em preto), depois cinza e 48x48 com a interpolação padrão do cv2.resize.
+    O cinza (em float, sem arredondar para uint8) vem antes do encaixe: é linear por pixel,
+    então dá o mesmo resultado redimensionando 1 canal em vez de 3.
+    """
+    cinza = cv2.cvtColor(face_crop_bgr.astype(np.float32), cv2.COLOR_BGR2GRAY)
+    cinza *= 1.0 / 255.0
+    h, w = cinza.shape
+    fator = min(224 / h, 224 / w)
+    reduzido = cv2.resize(cinza, (int(w * fator), int(h * fator)))
+    dh, dw = 224 - reduzido.shape[0], 224 - reduzido.shape[1]
+    encaixado = np.pad(reduzido, ((dh // 2, dh - dh // 2), (dw // 2, dw - dw // 2)))
+    cv2.resize(encaixado, (48, 48), dst=destino)
+
+def preparar_lote_emocao(face_crops_bgr):
+    """Crops BGR (não vazios) → lote float32 (N, 48, 48, 1) em [0, 1], entrada do modelo de emoção."""
+    lote = _obter_buffer_emocao(len(face_crops_bgr))
+    for j, crop in enumerate(face_crops_bgr):
+        _preprocessar_emocao(crop, lote[j])
+    return lote[..., np.newaxis]
+
+def analisar_emocao(face_crops_bgr, caminho_onnx=None):
+    """
+    Emoção em lote: recebe uma lista de crops e devolve a emoção dominante de cada um
+    (um rótulo de EMOCOES, "unknown" se o fallback não trouxer rótulo), None para crops inválidos.
+
+    Todos os crops vão em um único forward pass do modelo de emoção (Keras, ou ONNX
+    quando caminho_onnx existe), sem a redetecção/validação por imagem do DeepFace.analyze;
+    o rótulo sai direto do argmax do lote, sem montar a distribuição por face.
+    Se o lote falhar, cai para a análise individual (skip + fallback).
+    """
+    resultados = [None] * len(face_crops_bgr)
+    validos = [i for i, c in enumerate(face_crops_bgr) if c is not None and c.size > 0]
+    if not validos:
+        return resultados
+
+    try:
+        lote = preparar_lote_emocao([face_crops_bgr[i] for i in validos])
+        modelo = obter_modelo("emotion", lambda: _construir_modelo_emocao(caminho_onnx))
+        # predict_on_batch: um único passo de forward para o lote inteiro, sem o
+        # tf.data/callbacks que o predict() do Keras monta a cada chamada
+        probs = np.asarray(modelo.predict_on_batch(lote))
+    except Exception:
+        for i in validos:
+            res = _analisar_emocao_individual(face_crops_bgr[i])
+            try:
+                resultados[i] = sys.intern(res["dominant_emotion"])
+            except (KeyError, TypeError):
+                resultados[i] = EMOCAO_DESCONHECIDA if res else None
+        return resultados
+
+    for i, idx in zip(validos, np.argmax(probs, axis=1).tolist()):
+        resultados[i] = EMOCOES[idx]
+
+    return resultados
+
+class CacheGrade:
+    """
+    Cache LRU de resultados por posição da face: chave = (célula do grid, tamanho em
+    blocos de 32 px), válida por ttl frames. Rostos parados entre frames analisados
+    reaproveitam o resultado em vez de passar de novo pelo modelo.
+    """
+    def __init__(self, grid: int, ttl: int, capacidade: int = 128):
+        self.grid = grid
+        self.ttl = ttl
+        self.capacidade = capacidade
+        self.itens = OrderedDict()  # chave -> (valor, indice_frame)
+        self.lock = Lock()
+
+    def chave(self, x: int, y: int, w: int, h: int) -> tuple:
+        return (x // self.grid, y // self.grid, w // 32, h // 32)
+
+    def obter(self, chave, indice_frame: int):
+        if self.ttl <= 0:
+            return None
+        with self.lock:
+            entrada = self.itens.get(chave)
+            if entrada is None:
+                return None
+            valor, indice_salvo = entrada
+            if abs(indice_frame - indice_salvo) > self.ttl:
+                del self.itens[chave]
+                return None
+            self.itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor, indice_frame: int) -> None:
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.itens[chave] = (valor, indice_frame)
+            self.itens.move_to_end(chave)
+            if len(self.itens) > self.capacidade:
+                self.itens.popitem(last=False)
+
+# mesmo critério do face_recognition.face_distance < 0.55, comparado ao quadrado (sem sqrt)
+LIMIAR_DISTANCIA_2 = 0.55 ** 2
+# abaixo disso um único Q @ E.T (BLAS) é mais rápido que montar/consultar o índice FAISS
+GALERIA_MIN_FAISS = 4096
+# a partir de quantas imagens fora do cache os encodings da galeria rodam em processos
+GALERIA_MIN_PROCESSOS = 32
+
+class GaleriaEncodings:
+    """
+    Encodings conhecidos como matriz contígua float32 (N, D), sem normalizar (os descritores
+    do dlib não são unitários), com ‖e‖² pré-calculado: a distância ao quadrado de todas as
+    faces do frame para toda a galeria sai de um único Q @ E.T (BLAS),
+    d² = ‖q‖² + ‖e‖² − 2·q·e.
+    """
+    def __init__(self, encodings):
+        self.E = np.ascontiguousarray(encodings, dtype=np.float32)
+        self.normas2 = np.einsum("ij,ij->i", self.E, self.E)
+
+    def __len__(self):
+        return len(self.E)
+
+    def mais_proximos(self, Q):
+        """(distância² ao mais próximo, índice dele) para cada linha de Q."""
+        D2 = self.normas2 - 2.0 * (Q @ self.E.T)
+        idxs = D2.argmin(axis=1)
+        d2 = D2[np.arange(len(Q)), idxs] + np.einsum("ij,ij->i", Q, Q)
+        return np.maximum(d2, 0.0), idxs
+
+def _ler_cache_encodings(caminho: str) -> dict:
+    """{arquivo: (mtime, encoding ou None)} salvo por _salvar_cache_encodings; {} se ausente/ilegível."""
+    try:
+        with np.load(caminho) as dados:
+            return {
+                arq: (mtime, enc if valido else None)
+                for arq, mtime, enc, valido in zip(
+                    dados["arquivos"].tolist(), dados["mtimes"].tolist(), dados["encodings"], dados["validos"].tolist()
+                )
+            }
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def _salvar_cache_encodings(caminho: str, cache: dict) -> None:
+    """Imagens sem rosto também entram (validos=False), para não serem reprocessadas."""
+    arquivos = list(cache)
+    encs = [enc for _, enc in cache.values() if enc is not None]
+    vazio = np.zeros_like(encs[0]) if encs else np.zeros(128)
+    try:
+        garantir_diretorio(os.path.dirname(caminho) or ".")
+        np.savez(
+            caminho,
+            arquivos=np.array(arquivos, dtype=str),
+            mtimes=np.array([cache[a][0] for a in arquivos], dtype=np.float64),
+            encodings=np.array([vazio if cache[a][1] is None else cache[a][1] for a in arquivos]).reshape(len(arquivos), -1),
+            validos=np.array([cache[a][1] is not None for a in arquivos], dtype=bool),
+        )
+    except OSError as e:
+        print(f"  ⚠️ Não foi possível salvar o cache de encodings: {e}")
+
+def _encoding_do_arquivo(caminho: str):
+    """(encoding da primeira face da imagem ou None, erro como texto ou None)."""
+    try:
+        img = _face_recognition().load_image_file(caminho)
+        encs = _face_recognition().face_encodings(img)
+        return (encs[0] if encs else None), None
+    except Exception as e:
+        return None, str(e)
+
+def _calcular_encodings_galeria(caminhos):
+    """
+    Encodings das imagens da galeria que não estavam no cache. A partir de
+    GALERIA_MIN_PROCESSOS imagens, divide o trabalho entre processos (spawn; cada
+    um carrega os modelos do dlib uma vez e processa lotes de 4 imagens).
+    """
+    n_processos = min(os.cpu_count() or 1, -(-len(caminhos) // 4))
+    if len(caminhos) < GALERIA_MIN_PROCESSOS or n_processos < 2:
+        return [_encoding_do_arquivo(c) for c in caminhos]
+    with ProcessPoolExecutor(n_processos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(_encoding_do_arquivo, caminhos, chunksize=4))
+
+def carregar_banco_faces(pasta_imagens, caminho_cache: str = None):
+    """
+    Lê as imagens de referência e empilha os encodings em uma GaleriaEncodings
+    (matriz contígua float32, sem normalizar).
+    Galerias grandes (>= GALERIA_MIN_FAISS, com faiss instalado) viram um índice FAISS.
+    Com caminho_cache, os encodings ficam nesse arquivo (.npz, fora da galeria) e só as
+    imagens novas ou modificadas (mtime) passam de novo pela CNN do face_recognition.
+    Retorna (indice, names); indice é None quando não há faces conhecidas.
+    """
     encodings, names = [], []
 
     if not os.path.exists(pasta_imagens):
         os.makedirs(pasta_imagens, exist_ok=True)
-        return [], []
+        return None, []
+
+    usar_cache = bool(caminho_cache)
+    cache = _ler_cache_encodings(caminho_cache) if usar_cache else {}
+    cache_novo = {}
 
     print(f"📂 Carregando identidades de: {pasta_imagens}")
-    for arq in os.listdir(pasta_imagens):
-        if arq.lower().endswith((".jpg", ".jpeg", ".png")):
-            try:
-                raw_name = os.path.splitext(arq)[0]
-                nome = re.sub(r"[0-9_]+$", "", raw_name).replace("_", " ").strip().title()
-
-                img = face_recognition.load_image_file(os.path.join(pasta_imagens, arq))
-                enc = face_recognition.face_encodings(img)
-                if enc:
-                    encodings.append(enc[0])
-                    names.append(nome)
-                    print(f"  ✅ Aprendido: {nome}")
-            except Exception as e:
-                print(f"  ❌ Erro {arq}: {e}")
+    # scandir: caminho e tipo vêm da leitura do diretório; stat() fica em cache no DirEntry
+    # (no Windows já vem junto, sem syscall extra)
+    with os.scandir(pasta_imagens) as entradas:
+        arquivos = [e for e in entradas if e.name.lower().endswith((".jpg", ".jpeg", ".png")) and e.is_file()]
+
+    # 1) o que já está no cache (mesmo mtime) não passa pela CNN
+    mtimes, pendentes = {}, []
+    for entrada in arquivos:
+        try:
+            mtimes[entrada.name] = mtime = entrada.stat().st_mtime
+        except OSError as e:
+            print(f"  ❌ Erro {entrada.name}: {e}")
+            continue
+        if entrada.name in cache and cache[entrada.name][0] == mtime:
+            cache_novo[entrada.name] = cache[entrada.name]
+        else:
+            pendentes.append(entrada)
+
+    # 2) imagens novas/alteradas, todas de uma vez (em paralelo se forem muitas)
+    recalculou = bool(pendentes)
+    for entrada, (enc, erro) in zip(pendentes, _calcular_encodings_galeria([e.path for e in pendentes])):
+        if erro is None:
+            cache_novo[entrada.name] = (mtimes[entrada.name], enc)
+        else:
+            print(f"  ❌ Erro {entrada.name}: {erro}")
+
+    # 3) galeria na ordem do diretório
+    for entrada in arquivos:
+        arq = entrada.name
+        if arq not in cache_novo or cache_novo[arq][1] is None:
+            continue
+        raw_name = os.path.splitext(arq)[0]
+        nome = raw_name.rstrip("0123456789_").replace("_", " ").strip().title()
+        encodings.append(cache_novo[arq][1])
+        names.append(nome)
+        print(f"  ✅ Aprendido: {nome}")
+
+    # imagens novas/alteradas ou removidas → regrava o cache
+    if usar_cache and (recalculou or cache_novo.keys() != cache.keys()):
+        _salvar_cache_encodings(caminho_cache, cache_novo)
 
-    return encodings, names
+    if not encodings:
+        return None, []
 
-def reconhecer_identidade(face_crop, known_encodings, known_names):
-    if not known_encodings or face_crop is None or face_crop.size == 0:
-        return "Desconhecido"
+    galeria = GaleriaEncodings(encodings)
+    if faiss is None or len(galeria) < GALERIA_MIN_FAISS:
+        return galeria, names
 
-    rgb = cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB)
-    h, w, _ = rgb.shape
+    # IndexFlatL2 devolve a distância euclidiana ao quadrado: mesmo limiar do caminho BLAS
+    indice = faiss.IndexFlatL2(galeria.E.shape[1])
+    indice.add(galeria.E)
+    return indice, names
 
-    enc_atual = face_recognition.face_encodings(rgb, known_face_locations=[(0, w, h, 0)])
-    if not enc_atual:
-        return "Desconhecido"
+_buffers_rgb = local()  # frame RGB reaproveitado entre chamadas da mesma thread
 
-    dists = face_recognition.face_distance(known_encodings, enc_atual[0])
-    idx = int(np.argmin(dists))
-    if float(dists[idx]) < 0.55:
-        return known_names[idx]
-    return "Desconhecido"
+def _converter_para_rgb(frame_bgr):
+    """BGR→RGB escrevendo sempre no mesmo buffer C-contíguo (dst=); recria só se a resolução mudar."""
+    buf = getattr(_buffers_rgb, "frame", None)
+    if buf is None or buf.shape != frame_bgr.shape:
+        buf = np.empty(frame_bgr.shape, dtype=np.uint8)
+        _buffers_rgb.frame = buf
+    return cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=buf)
+
+def _codificador_dlib():
+    """
+    (api do face_recognition, dlib) para descrever várias faces de uma imagem numa só
+    chamada do dlib; False se essa API interna não estiver disponível nesta versão.
+    """
+    def construir():
+        try:
+            api = importlib.import_module("face_recognition.api")
+            dlib = importlib.import_module("dlib")
+        except ImportError:
+            return False
+        if not (hasattr(api, "_raw_face_landmarks") and hasattr(api, "face_encoder")):
+            return False
+        return api, dlib
+    return obter_modelo("codificador_dlib", construir)
+
+def _codificar_faces(rgb, locais):
+    """
+    Mesmo resultado de face_encodings(rgb, locais), mas com um único compute_face_descriptor
+    para todas as faces (face_encodings chama o dlib uma vez por face; o dlib processa os
+    recortes alinhados em um só lote da ResNet).
+    """
+    codificador = _codificador_dlib()
+    if not codificador:
+        return _face_recognition().face_encodings(rgb, known_face_locations=locais)
+
+    api, dlib = codificador
+    # mesmos parâmetros do face_encodings: landmarks de 5 pontos, num_jitters=1
+    deteccoes = dlib.full_object_detections()
+    deteccoes.extend(api._raw_face_landmarks(rgb, locais, model="small"))
+    return [np.array(d) for d in api.face_encoder.compute_face_descriptor(rgb, deteccoes, 1)]
+
+def calcular_embeddings(frame_bgr, caixas):
+    """
+    Encodings de todas as faces de um frame em uma única chamada de face_encodings
+    (frame convertido para RGB uma vez, em buffer reaproveitado; caixas = lista de (x1, y1, x2, y2)).
+    Devolve uma matriz (N, 128) float32 alinhada com caixas.
+    """
+    if not caixas or frame_bgr is None or frame_bgr.size == 0:
+        return np.empty((0, 128), dtype=np.float32)
+
+    rgb = _converter_para_rgb(frame_bgr)
+
+    # face_recognition usa (top, right, bottom, left)
+    locais = [(y1, x2, y2, x1) for (x1, y1, x2, y2) in caixas]
+    encs = _codificar_faces(rgb, locais)
+    if len(encs) != len(caixas):
+        return np.empty((0, 128), dtype=np.float32)
+
+    return np.asarray(encs, dtype=np.float32)
+
+def reconhecer_identidade(Q, indice, names):
+    """
+    Busca em lote: todas as faces do frame em uma única operação — Q @ E.T na
+    GaleriaEncodings ou index.search no FAISS (galerias grandes). Mesma decisão do
+    face_distance: o mais próximo, se a distância euclidiana for < 0.55.
+    Q = encodings (N, D). Devolve uma lista de nomes alinhada com Q.
+    """
+    if indice is None or len(Q) == 0:
+        return ["Desconhecido"] * len(Q)
+
+    if isinstance(indice, GaleriaEncodings):
+        d2, idxs = indice.mais_proximos(Q)
+    else:
+        d2, idxs = indice.search(Q, 1)
+        d2, idxs = d2[:, 0], idxs[:, 0]
+
+    return [
+        names[int(idxs[i])] if float(d2[i]) < LIMIAR_DISTANCIA_2 else "Desconhecido"
+        for i in range(len(Q))
+    ]
 
 
 # ============================================================
 # DESENHO / RESUMO
 # ============================================================
+FONTE_ROTULO = cv2.FONT_HERSHEY_SIMPLEX
+ESCALA_ROTULO = 0.6
+ESPESSURA_ROTULO = 2
+MAX_SPRITES = 256
+
+_sprites_rotulo = {}  # (texto, cor) -> (sprite BGR, máscara uint8, pesos de mescla ou None, dx, dy)
+
+def _obter_sprite_rotulo(texto, cor):
+    """
+    Rótulo rasterizado uma única vez (putText em um canvas pequeno) e reaproveitado:
+    o mesmo "nome | emoção" se repete por vários frames. dx/dy = deslocamento do
+    canto superior esquerdo do sprite em relação à origem (baseline) do texto.
+    Com texto sem antialiasing (LINE_8) basta copiar pela máscara; builds do OpenCV
+    que suavizam o texto guardam também os pesos para mesclar com o fundo.
+    """
+    chave = (texto, cor)
+    sprite = _sprites_rotulo.get(chave)
+    if sprite is None:
+        (tw, th), baseline = cv2.getTextSize(texto, FONTE_ROTULO, ESCALA_ROTULO, ESPESSURA_ROTULO)
+        m = ESPESSURA_ROTULO  # margem para o traço grosso
+        canvas = np.zeros((th + baseline + 2 * m, tw + 2 * m, 3), dtype=np.uint8)
+        cv2.putText(canvas, texto, (m, m + th), FONTE_ROTULO, ESCALA_ROTULO, cor, ESPESSURA_ROTULO)
+        mascara = canvas.any(axis=2)
+
+        canal = int(np.argmax(cor))
+        alfa = canvas[..., canal].astype(np.float32) / float(max(cor[canal], 1))
+        pesos = None
+        if not np.all((alfa == 0) | (alfa == 1)):
+            canvas[mascara] = cor
+            pesos = (1.0 - alfa, alfa)
+
+        if len(_sprites_rotulo) >= MAX_SPRITES:
+            _sprites_rotulo.clear()
+        sprite = _sprites_rotulo[chave] = (canvas, mascara.astype(np.uint8), pesos, -m, -(m + th))
+    return sprite
+
+def _colar_sprite(frame, sprite, x, y):
+    """Aplica o texto no frame com origem em (x, y), recortando nas bordas."""
+    canvas, mascara, pesos, dx, dy = sprite
+    H, W = frame.shape[:2]
+    x0, y0 = x + dx, y + dy
+    x1, y1 = max(x0, 0), max(y0, 0)
+    x2, y2 = min(x0 + canvas.shape[1], W), min(y0 + canvas.shape[0], H)
+    if x2 <= x1 or y2 <= y1:
+        return
+    sy, sx = slice(y1 - y0, y2 - y0), slice(x1 - x0, x2 - x0)
+    roi = frame[y1:y2, x1:x2]
+    if pesos is None:
+        cv2.copyTo(canvas[sy, sx], mascara[sy, sx], roi)
+    else:
+        cv2.blendLinear(roi, canvas[sy, sx], pesos[0][sy, sx], pesos[1][sy, sx], dst=roi)
+
 def desenhar_anotacoes(frame, faces, w_img, h_img):
-    for f in faces:
-        x, y, w, h = f["x"], f["y"], f["w"], f["h"]
-        texto = f"{f.get('nome', 'Desconhecido')} | {f.get('emocao', 'unknown')}"
-        cor = (0, 255, 0) if f.get("nome", "Desconhecido") != "Desconhecido" else (0, 165, 255)
+    for (x, y, w, h), nome, emocao in zip(faces.xywh.tolist(), faces.nomes, faces.emocoes):
+        texto = f"{nome} | {emocao or 'unknown'}"
+        cor = (0, 255, 0) if nome != "Desconhecido" else (0, 165, 255)
 
         cv2.rectangle(frame, (x, y), (x + w, y + h), cor, 2)
-        cv2.putText(frame, texto, (x, max(20, y - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, cor, 2)
+        _colar_sprite(frame, _obter_sprite_rotulo(texto, cor), x, max(20, y - 10))
+
+class CamadaAnotacoes:
+    """
+    Todas as anotações de um conjunto de faces (retângulos + rótulos) rasterizadas uma
+    única vez em uma camada que cobre só a região anotada (união das caixas), com máscara.
+    Enquanto as faces não mudam, cada frame recebe as anotações em um único cv2.copyTo,
+    sem redesenhar face a face. Em builds do OpenCV que suavizam o texto a mescla na
+    união custaria mais que o desenho direto, então a camada só delega para ele.
+    """
+    def __init__(self, faces, largura, altura):
+        self.roi = None
+        self.faces, self.largura, self.altura = faces, largura, altura
+        if not len(faces):
+            return
+
+        itens = []
+        for (x, y, w, h), nome, emocao in zip(faces.xywh.tolist(), faces.nomes, faces.emocoes):
+            cor = (0, 255, 0) if nome != "Desconhecido" else (0, 165, 255)
+            sprite = _obter_sprite_rotulo(f"{nome} | {emocao or 'unknown'}", cor)
+            if sprite[2] is not None:
+                return  # texto com antialiasing: desenho direto
+            itens.append((x, y, w, h, cor, sprite, max(20, y - 10)))
+
+        # união das regiões tocadas (retângulo com a espessura para fora + sprite)
+        m = 2
+        x1 = min(min(x - m, x + s[3]) for x, y, w, h, cor, s, ty in itens)
+        y1 = min(min(y - m, ty + s[4]) for x, y, w, h, cor, s, ty in itens)
+        x2 = max(max(x + w + m + 1, x + s[3] + s[0].shape[1]) for x, y, w, h, cor, s, ty in itens)
+        y2 = max(max(y + h + m + 1, ty + s[4] + s[0].shape[0]) for x, y, w, h, cor, s, ty in itens)
+        x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, largura), min(y2, altura)
+        if x2 <= x1 or y2 <= y1:
+            self.faces = FacesFrame()
+            return
+
+        canvas = np.zeros((y2 - y1, x2 - x1, 3), dtype=np.uint8)
+        mascara = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+        for x, y, w, h, cor, sprite, ty in itens:
+            # mesma ordem do desenho direto: retângulo e depois o rótulo, face a face
+            cv2.rectangle(canvas, (x - x1, y - y1), (x + w - x1, y + h - y1), cor, 2)
+            cv2.rectangle(mascara, (x - x1, y - y1), (x + w - x1, y + h - y1), 1, 2)
+            _colar_sprite(canvas, sprite, x - x1, ty - y1)
+            _colar_sprite(mascara, (sprite[1], sprite[1], None, sprite[3], sprite[4]), x - x1, ty - y1)
+
+        self.roi = (slice(y1, y2), slice(x1, x2))
+        self.canvas, self.mascara = canvas, mascara
+
+    def aplicar(self, frame):
+        if self.roi is None:
+            desenhar_anotacoes(frame, self.faces, self.largura, self.altura)
+        else:
+            cv2.copyTo(self.canvas, self.mascara, frame[self.roi])
 
 def escrever_resumo(caminho, dados):
     """
     Escreve um resumo "genérico" para Step A e também funciona para Step B/C,
     imprimindo chaves conhecidas quando existirem.
+    O texto é montado em memória e gravado em uma única escrita.
     """
-    with open(caminho, "w", encoding="utf-8") as f:
-        f.write("=== RESUMO ===\n")
+    linhas = ["=== RESUMO ===\n"]
 
-        # imprime chaves comuns se existirem
-        for k in ["video", "frames_totais", "frames_analisados", "frame_step", "total_faces"]:
-            if k in dados:
-                f.write(f"{k}: {dados[k]}\n")
+    # imprime chaves comuns se existirem
+    for k in ["video", "frames_totais", "frames_analisados", "frame_step", "total_faces"]:
+        if k in dados:
+            linhas.append(f"{k}: {dados[k]}\n")
 
-        # emoções (step A)
-        contador_emocoes = dados.get("contador_emocoes")
-        if contador_emocoes:
-            f.write("\nEmocoes (contagem):\n")
-            try:
-                for emo, v in contador_emocoes.most_common():
-                    f.write(f"- {emo}: {v}\n")
-            except Exception:
-                # se vier como dict simples
-                for emo, v in contador_emocoes.items():
-                    f.write(f"- {emo}: {v}\n")
-
-        # limiares (step A)
-        limiares = dados.get("limiares")
-        if limiares:
-            f.write("\nLimiar (final):\n")
-            for k, v in limiares.items():
-                f.write(f"- {k}: {v}\n")
-
-        # params extras
-        if "k_persistencia" in dados:
-            f.write(f"\nK Persistencia: {dados['k_persistencia']}\n")
-        if "tamanho_grid" in dados:
-            f.write(f"Tamanho Grid: {dados['tamanho_grid']}\n")
-
-        # dump de qualquer outra chave (pra não perder info do step B)
-        known = {"video","frames_totais","frames_analisados","frame_step","total_faces",
-                 "contador_emocoes","limiares","k_persistencia","tamanho_grid"}
-        extras = {k:v for k,v in dados.items() if k not in known}
-        if extras:
-            f.write("\nOutros:\n")
-            for k,v in extras.items():
-                f.write(f"- {k}: {v}\n")
+    # emoções (step A)
+    contador_emocoes = dados.get("contador_emocoes")
+    if contador_emocoes:
+        linhas.append("\nEmocoes (contagem):\n")
+        # Counter ou dict simples: ordem decrescente por argsort estável (empates na ordem
+        # de inserção, como o most_common), sem o heap/sort de tuplas em Python
+        itens = list(contador_emocoes.items())
+        contagens = np.fromiter((v for _, v in itens), dtype=np.int64, count=len(itens))
+        for i in np.argsort(-contagens, kind="stable").tolist():
+            linhas.append(f"- {itens[i][0]}: {itens[i][1]}\n")
+
+    # limiares (step A)
+    limiares = dados.get("limiares")
+    if limiares:
+        linhas.append("\nLimiar (final):\n")
+        for k, v in limiares.items():
+            linhas.append(f"- {k}: {v}\n")
+
+    # params extras
+    if "k_persistencia" in dados:
+        linhas.append(f"\nK Persistencia: {dados['k_persistencia']}\n")
+    if "tamanho_grid" in dados:
+        linhas.append(f"Tamanho Grid: {dados['tamanho_grid']}\n")
+
+    # dump de qualquer outra chave (pra não perder info do step B)
+    known = {"video","frames_totais","frames_analisados","frame_step","total_faces",
+             "contador_emocoes","limiares","k_persistencia","tamanho_grid"}
+    extras = {k:v for k,v in dados.items() if k not in known}
+    if extras:
+        linhas.append("\nOutros:\n")
+        for k,v in extras.items():
+            linhas.append(f"- {k}: {v}\n")
+
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write("".join(linhas))
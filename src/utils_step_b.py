@@ -1,6 +1,5 @@
 import cv2
 import mediapipe as mp
-import numpy as np
 
 # Inicializa MediaPipe Pose
 mp_pose = mp.solutions.pose
@@ -17,49 +16,60 @@ def iniciar_pose():
         min_tracking_confidence=0.5
     )
 
-def calcular_distancia(p1, p2):
-    """Calcula distância euclidiana simples entre dois pontos (x,y)."""
-    return np.sqrt((p1.x - p2.x)**2 + (p1.y - p2.y)**2)
+# índices dos landmarks usados nas heurísticas (resolvidos uma vez, fora do laço por frame)
+NARIZ = mp_pose.PoseLandmark.NOSE.value
+PULSO_E = mp_pose.PoseLandmark.LEFT_WRIST.value
+PULSO_D = mp_pose.PoseLandmark.RIGHT_WRIST.value
+OMBRO_E = mp_pose.PoseLandmark.LEFT_SHOULDER.value
+OMBRO_D = mp_pose.PoseLandmark.RIGHT_SHOULDER.value
+COTOVELO_E = mp_pose.PoseLandmark.LEFT_ELBOW.value
+COTOVELO_D = mp_pose.PoseLandmark.RIGHT_ELBOW.value
+
+LIMIAR_MAO_ROSTO_2 = 0.15 ** 2  # punho a menos de 0.15 do nariz (coordenadas normalizadas)
 
 def classificar_atividade(landmarks):
     """
     Classifica a atividade baseada na posição relativa dos pontos (landmarks).
+    Cada coordenada é lida do protobuf uma única vez; o resto é aritmética em floats
+    (7 pontos por frame: numpy aqui custaria mais do que economiza).
     """
     if not landmarks:
         return "Desconhecido"
 
     # Pontos chave
-    nose = landmarks[mp_pose.PoseLandmark.NOSE.value]
-    l_wrist = landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value]
-    r_wrist = landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value]
-    l_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-    r_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
-    l_elbow = landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value]
-    r_elbow = landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW.value]
+    nose = landmarks[NARIZ]
+    l_wrist = landmarks[PULSO_E]
+    r_wrist = landmarks[PULSO_D]
+    nose_x, nose_y = nose.x, nose.y
+    lw_x, lw_y = l_wrist.x, l_wrist.y
+    rw_x, rw_y = r_wrist.x, r_wrist.y
 
     # --- HEURÍSTICA 1: BRAÇOS LEVANTADOS (Comemoração/Susto) ---
-    if l_wrist.y < nose.y and r_wrist.y < nose.y:
-        if abs(l_wrist.x - nose.x) > 0.10:
+    if lw_y < nose_y and rw_y < nose_y:
+        if abs(lw_x - nose_x) > 0.10:
             return "Bracos Levantados"
 
     # --- HEURÍSTICA 2: MÃO NO ROSTO (Pensativo/Espanto) ---
-    dist_l_nose = calcular_distancia(l_wrist, nose)
-    dist_r_nose = calcular_distancia(r_wrist, nose)
-    
-    if dist_l_nose < 0.15 or dist_r_nose < 0.15:
+    # distâncias ao quadrado contra o limiar ao quadrado (sem raiz)
+    dlx, dly = lw_x - nose_x, lw_y - nose_y
+    drx, dry = rw_x - nose_x, rw_y - nose_y
+    dist2_l_nose = dlx * dlx + dly * dly
+    dist2_r_nose = drx * drx + dry * dry
+
+    if dist2_l_nose < LIMIAR_MAO_ROSTO_2 or dist2_r_nose < LIMIAR_MAO_ROSTO_2:
         return "Mao no Rosto/Pensativo"
 
     # --- HEURÍSTICA 3: BRAÇOS CRUZADOS (Defensivo) ---
-    altura_media_ombro = (l_shoulder.y + r_shoulder.y) / 2
-    altura_media_cotovelo = (l_elbow.y + r_elbow.y) / 2
-    esta_na_altura_peito = (l_wrist.y > altura_media_ombro) and (l_wrist.y < altura_media_cotovelo)
-    dist_punhos = abs(l_wrist.x - r_wrist.x)
-    
-    if esta_na_altura_peito and dist_punhos < 0.15:
-        return "Bracos Cruzados/Fechado"
+    dist_punhos = abs(lw_x - rw_x)
+    if dist_punhos < 0.15:
+        # ombros/cotovelos só são lidos quando os punhos estão próximos
+        altura_media_ombro = (landmarks[OMBRO_E].y + landmarks[OMBRO_D].y) / 2
+        altura_media_cotovelo = (landmarks[COTOVELO_E].y + landmarks[COTOVELO_D].y) / 2
+        if altura_media_ombro < lw_y < altura_media_cotovelo:
+            return "Bracos Cruzados/Fechado"
 
     # --- HEURÍSTICA 4: MÃOS JUNTAS (Rezando/Interação) ---
-    if dist_punhos < 0.10 and l_wrist.y > nose.y:
+    if dist_punhos < 0.10 and lw_y > nose_y:
         return "Maos Juntas"
 
     # --- PADRÃO ---